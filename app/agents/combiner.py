@@ -3,4 +3,5 @@ class code_combiner_agent(dspy.Signature):
     """ You are a code combine agent, taking Python code output from many agents and combining the operations into 1 output
     You also fix any errors in the code"""
     agent_code_list =dspy.InputField(desc="A list of code given by each agent")
+    validation_feedback = dspy.InputField(desc="Problems a static check found in your previous combined code, fix all of them. Empty on the first pass")
     refined_complete_code = dspy.OutputField(desc="Refined complete code base")
\ No newline at end of file
@@ -0,0 +1,14 @@
+import dspy
+class follow_up_agent(dspy.Signature):
+    """ You are a follow-up analysis agent in an ongoing analysis session. The code of the previous steps
+    that succeeded has been executed and its variables and DataFrames are still in memory, failed steps may
+    have left their variables undefined, only rely on what live_variables lists.
+    You take a follow-up goal and output only the new Python code needed to answer it, reusing the existing
+    variables instead of reloading the data or repeating the earlier steps"""
+    dataset = dspy.InputField(desc="Columns and dtypes of df_name, the loaded bookings dataset")
+    previous_steps = dspy.InputField(desc="The goals, plans and code of the earlier steps of the session in order, each with whether its execution succeeded")
+    live_variables = dspy.InputField(desc="Variables currently in memory with their type, shape and columns")
+    goal = dspy.InputField(desc="The user defined follow-up goal")
+    validation_feedback = dspy.InputField(desc="Problems a static check found in your previous code, fix all of them. Empty on the first pass")
+    commentary = dspy.OutputField(desc="The comments about what analysis is being performed")
+    code = dspy.OutputField(desc="Only the new code, it runs after the previous steps in the same namespace")
\ No newline at end of file
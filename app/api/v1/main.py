@@ -1,134 +1,558 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse
+from starlette.background import BackgroundTask
 import os
 import sys
 sys.path.append('..')
-import tempfile
 import shutil
+import tempfile
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from app.core.processor import auto_analyst
-from app.agents.analysis import preprocessing_agent, statistical_analytics_agent, sk_learn_agent
-import dspy
-import os
 ### Load environment variables
+# before the app modules below, which read their settings at import time
 from dotenv import load_dotenv
 load_dotenv(dotenv_path='.env')
+# Only light modules are imported here. dspy, pandas and the LM client are
+# imported by warm_up(), which the lifespan hook runs in the background, so
+# the worker binds its port and answers /health/ right away
+from app.core.sampling import DEFAULT_SAMPLE_FRAC
+from app.core.uploads import save_upload, UploadError, MAX_UPLOAD_BYTES
+from app.core.store import DatasetStore, DatasetNotFound, SessionNotFound, DATA_DIR
+from app.api.v1.middleware import RequestSizeLimitMiddleware
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Warm up in the background, /ready/ reports when it has finished
+    warmup_thread = threading.Thread(target=warm_up_in_background, daemon=True)
+    warmup_thread.start()
+    yield
 
-lm = dspy.LM('openai/gpt-4o-mini', api_key=os.getenv('OPENAI_API_KEY'))
-dspy.configure(lm=lm)
 # Initialize FastAPI app
 app = FastAPI(
     title="Auto Analyst API",
     description="Automated data analysis system using DSPy agents",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+# Both datasets travel in one multipart request
+app.add_middleware(RequestSizeLimitMiddleware, max_body_bytes=2 * MAX_UPLOAD_BYTES)
 
 
 # Define request models
 class AnalysisRequest(BaseModel):
     query: str
 
+# Define response models, only the fields clients use are sent instead of the raw dspy Predictions
+class PlannerResult(BaseModel):
+    plan: str
+    plan_desc: Optional[str] = None
+    reasoning: Optional[str] = None
+
+class AgentResult(BaseModel):
+    code: str
+    commentary: Optional[str] = None
+    reasoning: Optional[str] = None
+
+class CombinerResult(BaseModel):
+    refined_complete_code: str
+    validation_issues: list[str] = []
+    vectorized_rewrites: list[str] = []
+    reasoning: Optional[str] = None
+
+class AnalysisResult(BaseModel):
+    analytical_planner: Optional[PlannerResult] = None
+    agents: Optional[dict[str, AgentResult]] = None
+    code_combiner_agent: Optional[CombinerResult] = None
+    # set instead of the other fields when one query of a batch failed
+    error: Optional[str] = None
+
+class SamplingPlan(BaseModel):
+    frac: float
+    seed: int
+    airline_column: Optional[str] = None
+    month_column: Optional[str] = None
+
 class AnalysisResponse(BaseModel):
     status: str
-    result: dict
+    dataset_id: Optional[str] = None
+    result: AnalysisResult
+    message: str
+    sampling_plan: Optional[SamplingPlan] = None
+
+class BatchAnalysisRequest(BaseModel):
+    queries: list[str]
+    fields: Optional[str] = None
+    months: Optional[str] = None
+    include_reasoning: bool = True
+
+class BatchAnalysisResponse(BaseModel):
+    status: str
+    dataset_id: str
+    results: list[AnalysisResult]
+    message: str
+
+class LiveVariable(BaseModel):
+    type: str
+    shape: Optional[list[int]] = None
+    columns: Optional[dict[str, str]] = None
+    value: Optional[str] = None
+
+class SessionQueryRequest(BaseModel):
+    query: str
+    # what the client's session process holds after the previous turns
+    live_variables: dict[str, LiveVariable] = {}
+    fields: Optional[str] = None
+    include_reasoning: bool = True
+
+class SessionQueryResponse(BaseModel):
+    status: str
+    session_id: str
+    turn: int
+    follow_up: bool
+    result: AnalysisResult
     message: str
 
-# Global variable to store the auto_analyst instance
-auto_analyst_instance = None
+class TurnResult(BaseModel):
+    success: bool
+    # traceback or message of the failure, shown to later follow-ups
+    error: Optional[str] = None
+
+# groups of the analysis result a client can ask for with ?fields=
+RESULT_FIELDS = {'plan', 'agents', 'final_code'}
+
+
+def build_analysis_result(output_dict, fields=RESULT_FIELDS, include_reasoning=True):
+    """Convert the auto_analyst output into the typed result, keeping only the requested fields"""
+    def prediction_fields(prediction, model):
+        values = {k: prediction.get(k) for k in model.model_fields if k in prediction}
+        if not include_reasoning:
+            values.pop('reasoning', None)
+        return model(**values)
+
+    result = AnalysisResult()
+    # follow-ups in a session have no plan
+    if 'plan' in fields and 'analytical_planner' in output_dict:
+        result.analytical_planner = prediction_fields(output_dict['analytical_planner'], PlannerResult)
+    if 'agents' in fields:
+        result.agents = {
+            name: prediction_fields(prediction, AgentResult)
+            for name, prediction in output_dict.items()
+            if name not in ('analytical_planner', 'code_combiner_agent')
+        }
+    if 'final_code' in fields:
+        result.code_combiner_agent = prediction_fields(output_dict['code_combiner_agent'], CombinerResult)
+    return result
+
+# Datasets, their parsed form and the LLM response cache live under DATA_DIR,
+# which all workers of a multi-process deployment share
+dataset_store = DatasetStore(DATA_DIR)
+
+# Largest batch accepted by /datasets/{dataset_id}/analyze/batch/ and the shared
+# limit on concurrent LLM calls of one dataset's analyses
+MAX_BATCH_QUERIES = int(os.getenv('MAX_BATCH_QUERIES', 50))
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', 8))
+
+# Per-worker (dataset version, auto_analyst) by dataset id and months, most recently used last
+MAX_CACHED_DATASETS = int(os.getenv('MAX_CACHED_DATASETS', 4))
+auto_analyst_instances = OrderedDict()
+auto_analyst_lock = threading.Lock()
+
+# Agent registry and warm-up progress, filled in by warm_up()
+registry = {}
+warmup_state = {"ready": False, "error": None, "timings": {}}
+warmup_lock = threading.Lock()
+
+
+def warm_up():
+    """
+    Import the agents, configure the LM and build the agent registry, then
+    preload the datasets listed in PRELOAD_DATASETS. Runs once per worker,
+    requests that need the agents call it and wait if it is still running
+    """
+    with warmup_lock:
+        if warmup_state["ready"]:
+            return
+        timings = warmup_state["timings"]
+
+        start = time.perf_counter()
+        import dspy
+        from app.core.processor import auto_analyst
+        from app.core.compiler import DEFAULT_COMPILED_DIR
+        from app.agents.analysis import preprocessing_agent, statistical_analytics_agent, sk_learn_agent
+        timings["imports"] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        # an LM configured by the embedding process (e.g. tests) is kept
+        if dspy.settings.lm is None:
+            dspy.configure(lm=dspy.LM('openai/gpt-4o-mini', api_key=os.getenv('OPENAI_API_KEY')))
+        dspy.configure_cache(enable_disk_cache=True, disk_cache_dir=os.path.join(DATA_DIR, 'dspy_cache'))
+        registry.update(
+            auto_analyst=auto_analyst,
+            # Define available agents
+            agents=[
+                preprocessing_agent, 
+                statistical_analytics_agent, 
+                sk_learn_agent
+            ],
+            # Directory with the programs compiled offline by `python -m app.core.compiler`
+            compiled_dir=os.getenv('COMPILED_PROGRAMS_DIR', DEFAULT_COMPILED_DIR)
+        )
+        timings["module_build"] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        for dataset_id in filter(None, (d.strip() for d in os.getenv('PRELOAD_DATASETS', '').split(','))):
+            try:
+                get_auto_analyst(dataset_id)
+            except HTTPException:
+                logger.warning("Dataset %s from PRELOAD_DATASETS is not registered", dataset_id)
+        timings["dataset_preload"] = round(time.perf_counter() - start, 3)
+
+        warmup_state["ready"] = True
+        warmup_state["error"] = None
+
+
+def warm_up_in_background():
+    try:
+        warm_up()
+    except Exception as e:
+        # the next request retries, /ready/ reports the failure meanwhile
+        logger.exception("Warm-up failed")
+        warmup_state["error"] = str(e)
+
 
-# Define available agents
-AVAILABLE_AGENTS = [
-    preprocessing_agent, 
-    statistical_analytics_agent, 
-    sk_learn_agent
-]
+def parse_months(months):
+    """Comma separated departure months (YYYY-MM) to a hashable set, None for all"""
+    if not months:
+        return None
+    return frozenset(m.strip() for m in months.split(',') if m.strip())
 
 
-# @app.post("/upload-files/")
+def get_auto_analyst(dataset_id, months=None):
+    """
+    Return the auto_analyst for a registered dataset, restricted to the given
+    departure months if any. It is built from the shared memory-mapped
+    partitions the first time this worker sees the dataset, and again after a
+    delta is appended, which only reads the new partitions
+    """
+    key = (dataset_id, months)
+    try:
+        version = dataset_store.version(dataset_id)
+        flight_bookings_path, airline_mapping_path = dataset_store.paths(dataset_id)
+    except DatasetNotFound:
+        raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
+    with auto_analyst_lock:
+        if key in auto_analyst_instances and auto_analyst_instances[key][0] == version:
+            auto_analyst_instances.move_to_end(key)
+            return auto_analyst_instances[key][1]
+    try:
+        flight_bookings = dataset_store.load_bookings(dataset_id, months)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    instance = registry['auto_analyst'](
+        agents=registry['agents'],
+        flight_bookings_path=flight_bookings_path,
+        airline_mapping_path=airline_mapping_path,
+        compiled_dir=registry['compiled_dir'],
+        flight_bookings=flight_bookings,
+        max_concurrent_llm_calls=LLM_CONCURRENCY
+    )
+    with auto_analyst_lock:
+        auto_analyst_instances[key] = (version, instance)
+        auto_analyst_instances.move_to_end(key)
+        while len(auto_analyst_instances) > MAX_CACHED_DATASETS:
+            auto_analyst_instances.popitem(last=False)
+    return instance
+
+
+def parse_fields(fields):
+    selected_fields = RESULT_FIELDS if fields is None else {f.strip() for f in fields.split(',') if f.strip()}
+    if not selected_fields <= RESULT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Unknown fields {sorted(selected_fields - RESULT_FIELDS)}, expected a subset of {sorted(RESULT_FIELDS)}")
+    return selected_fields
+
+
+def run_analysis(dataset_id, query, sample, sample_frac, selected_fields, include_reasoning, months=None):
+    """Run the agents on a registered dataset, blocking, so called from the threadpool"""
+    warm_up()
+    auto_analyst_instance = get_auto_analyst(dataset_id, months)
+    if sample:
+        try:
+            sampling_plan = auto_analyst_instance.sampling_plan(sample_frac)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    analysis_result = auto_analyst_instance.forward(query)
+    print(query)
+    return AnalysisResponse(
+        status="success",
+        message="Analysis completed",
+        dataset_id=dataset_id,
+        result=build_analysis_result(analysis_result, selected_fields, include_reasoning),
+        sampling_plan=sampling_plan if sample else None
+    )
+
+
+@app.post("/datasets/")
 async def upload_files(
-    flight_bookings: UploadFile = File(..., description="Flight bookings CSV file"),
-    airline_mapping: UploadFile = File(..., description="Airline ID to Name mapping CSV file")
+    flight_bookings: UploadFile = File(..., description="Flight bookings file: .csv, .csv.gz, .csv.zst or .parquet"),
+    airline_mapping: UploadFile = File(..., description="Airline ID to Name mapping file: .csv, .csv.gz, .csv.zst or .parquet"),
+    flight_bookings_sha256: Optional[str] = None,
+    airline_mapping_sha256: Optional[str] = None
+):
+        """
+        Upload the required files and register them in the shared dataset store.
+        Compressed files are decompressed while they are written to disk and
+        checked against the sha256 of the uploaded bytes when one is given.
+        Uploading the same content again returns the existing dataset id
+        """
+        # Stream uploaded files to a directory inside the store
+        upload_dir = dataset_store.upload_dir()
+        try:
+            flight_bookings_path, _, flight_bookings_content = await run_in_threadpool(save_upload, flight_bookings, upload_dir, "flight_bookings", flight_bookings_sha256)
+            airline_mapping_path, _, airline_mapping_content = await run_in_threadpool(save_upload, airline_mapping, upload_dir, "airline_mapping", airline_mapping_sha256)
+        except UploadError as e:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+        dataset_id = await run_in_threadpool(
+            dataset_store.register, flight_bookings_path, airline_mapping_path, flight_bookings_content, airline_mapping_content
+        )
+        return {"dataset_id": dataset_id}
+
+@app.post("/datasets/{dataset_id}/append/")
+async def append_dataset(
+    dataset_id: str,
+    delta: UploadFile = File(..., description="New bookings with the dataset's columns: .csv, .csv.gz, .csv.zst or .parquet"),
+    delta_sha256: Optional[str] = None
 ):
         """
-        Upload the required CSV files and reinitialize the auto_analyst system
-        """
-        global auto_analyst_instance
-        
-    # try:
-        # Validate file extensions
-        if not flight_bookings.filename.endswith('.csv'):
-            raise HTTPException(status_code=400, detail="Flight bookings file must be a CSV")
-        if not airline_mapping.filename.endswith('.csv'):
-            raise HTTPException(status_code=400, detail="Airline mapping file must be a CSV")
-        
-        # Create temporary directory
-        temp_dir = tempfile.mkdtemp()
-        
-        # Save uploaded files to temporary directory
-        flight_bookings_path = os.path.join(temp_dir, "flight_bookings.csv")
-        airline_mapping_path = os.path.join(temp_dir, "airline_mapping.csv")
-        
-        # Write flight bookings file
-        with open(flight_bookings_path, "wb") as buffer:
-            shutil.copyfileobj(flight_bookings.file, buffer)
-        
-        # Write airline mapping file
-        with open(airline_mapping_path, "wb") as buffer:
-            shutil.copyfileobj(airline_mapping.file, buffer)
-        
-        # Reinitialize auto_analyst with uploaded files
-        auto_analyst_instance = auto_analyst(
-            agents=AVAILABLE_AGENTS,
-            flight_bookings_path=flight_bookings_path,
-            airline_mapping_path=airline_mapping_path
+        Append a bookings delta, e.g. the day's new bookings, to a registered dataset
+        without uploading the history again. The rows are stored as new partitions
+        by departure month and the column statistics are updated in place; the next
+        analysis of the dataset only reads the new partitions.
+        Appending the same file twice adds it once
+        """
+        upload_dir = dataset_store.upload_dir()
+        try:
+            delta_path, _, delta_content = await run_in_threadpool(save_upload, delta, upload_dir, "delta", delta_sha256)
+        except UploadError as e:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        try:
+            return await run_in_threadpool(dataset_store.append, dataset_id, delta_path, delta_content)
+        except DatasetNotFound:
+            raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/datasets/{dataset_id}/bookings/")
+async def export_bookings(dataset_id: str, months: Optional[str] = None):
+        """
+        Download the stored bookings as Parquet, including every appended delta,
+        only the given departure months (comma separated YYYY-MM) if any.
+        Generated code runs where the data is loaded, so scripts analysing an
+        appended dataset read it from here instead of a local copy
+        """
+        fd, path = tempfile.mkstemp(dir=dataset_store.uploads_dir, suffix='.parquet')
+        os.close(fd)
+        try:
+            await run_in_threadpool(dataset_store.write_bookings, dataset_id, path, parse_months(months))
+        except DatasetNotFound:
+            os.remove(path)
+            raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
+        except ValueError as e:
+            os.remove(path)
+            raise HTTPException(status_code=400, detail=str(e))
+        return FileResponse(
+            path, media_type="application/vnd.apache.parquet", filename=f"{dataset_id}.parquet", background=BackgroundTask(os.remove, path)
         )
-        
-        return {"files": {"flight_bookings": flight_bookings_path,"airline_mapping": airline_mapping_path}}
-            
-                
-            
-        
-    # except Exception as e:
-    #     raise HTTPException(status_code=500, detail=f"Failed to upload files: {str(e)}")
-
-@app.post("/analyze/")
+
+@app.get("/datasets/{dataset_id}/stats/")
+async def dataset_stats(dataset_id: str):
+        """Row counts by departure month and count, mean, std, min and max of the numeric columns"""
+        try:
+            return await run_in_threadpool(dataset_store.stats, dataset_id)
+        except DatasetNotFound:
+            raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
+
+@app.post("/datasets/{dataset_id}/analyze/", response_model=AnalysisResponse, response_model_exclude_none=True)
+async def analyze_dataset(
+    dataset_id: str,
+    query: str,
+    sample: bool = False,
+    sample_frac: float = DEFAULT_SAMPLE_FRAC,
+    fields: Optional[str] = None,
+    include_reasoning: bool = True,
+    months: Optional[str] = None
+):
+        """
+        Analyze a dataset registered with /datasets/ without uploading it again.
+        Takes the same options as /analyze/, months is a comma separated list of
+        departure months (YYYY-MM) to analyze instead of the whole history
+        """
+        selected_fields = parse_fields(fields)
+        return await run_in_threadpool(run_analysis, dataset_id, query, sample, sample_frac, selected_fields, include_reasoning, parse_months(months))
+
+def run_batch_analysis(dataset_id, queries, selected_fields, include_reasoning, months=None):
+    """Run several queries on a registered dataset in one pass, blocking, so called from the threadpool"""
+    warm_up()
+    auto_analyst_instance = get_auto_analyst(dataset_id, months)
+    analysis_results = auto_analyst_instance.forward_batch(queries)
+    failed = sum(isinstance(r, Exception) for r in analysis_results)
+    return BatchAnalysisResponse(
+        status="success" if not failed else "partial" if failed < len(queries) else "error",
+        message=f"Analysed {len(queries) - failed} of {len(queries)} queries",
+        dataset_id=dataset_id,
+        results=[
+            AnalysisResult(error=f"{type(r).__name__}: {r}") if isinstance(r, Exception)
+            else build_analysis_result(r, selected_fields, include_reasoning)
+            for r in analysis_results
+        ]
+    )
+
+@app.post("/datasets/{dataset_id}/analyze/batch/", response_model=BatchAnalysisResponse, response_model_exclude_none=True)
+async def analyze_dataset_batch(dataset_id: str, request: BatchAnalysisRequest):
+        """
+        Analyze a list of queries against one registered dataset. The dataset is
+        loaded and formatted once, the LLM calls of all queries run concurrently
+        under a shared limit and identical sub-plans are only generated once.
+        Results are returned in the order of the queries, a query that failed
+        has only an error and doesn't fail the others
+        """
+        queries = [q.strip() for q in request.queries]
+        if not queries or not all(queries):
+            raise HTTPException(status_code=400, detail="queries must be a non-empty list of non-empty strings")
+        if len(queries) > MAX_BATCH_QUERIES:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+        selected_fields = parse_fields(request.fields)
+        return await run_in_threadpool(run_batch_analysis, dataset_id, queries, selected_fields, request.include_reasoning, parse_months(request.months))
+
+def run_session_query(session_id, request, selected_fields):
+    """Answer the next query of a session, blocking, so called from the threadpool"""
+    warm_up()
+    try:
+        dataset_id = dataset_store.session_dataset(session_id)
+        turns = dataset_store.session_turns(session_id)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+    auto_analyst_instance = get_auto_analyst(dataset_id)
+    if turns:
+        live_variables = {name: v.model_dump(exclude_none=True) for name, v in request.live_variables.items()}
+        analysis_result = auto_analyst_instance.follow_up(request.query, turns, live_variables)
+        plan = None
+    else:
+        analysis_result = auto_analyst_instance.forward(request.query)
+        plan = analysis_result['analytical_planner'].plan
+    turn = dataset_store.add_session_turn(
+        session_id, request.query, plan, analysis_result['code_combiner_agent'].refined_complete_code
+    )
+    return SessionQueryResponse(
+        status="success",
+        message="Follow-up completed" if turns else "Analysis completed",
+        session_id=session_id,
+        turn=turn,
+        follow_up=bool(turns),
+        result=build_analysis_result(analysis_result, selected_fields, request.include_reasoning)
+    )
+
+@app.post("/sessions/")
+async def create_session(dataset_id: str):
+        """
+        Start an analysis session on a registered dataset. The first query of the
+        session is planned as usual, follow-ups get only the code to run after the
+        previous turns in the client's session process
+        """
+        try:
+            session_id = await run_in_threadpool(dataset_store.create_session, dataset_id)
+        except DatasetNotFound:
+            raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
+        return {"session_id": session_id, "dataset_id": dataset_id}
+
+@app.post("/sessions/{session_id}/query/", response_model=SessionQueryResponse, response_model_exclude_none=True)
+async def query_session(session_id: str, request: SessionQueryRequest):
+        """
+        Ask the next question of a session. live_variables describes the variables
+        the client's session process holds (type, shape, DataFrame columns), so the
+        follow-up code builds on them instead of recomputing the earlier steps.
+        Report the outcome of running the returned code to
+        /sessions/{session_id}/turns/{turn}/result/.
+        Takes the same fields and include_reasoning options as /analyze/
+        """
+        if not request.query.strip():
+            raise HTTPException(status_code=400, detail="query must not be empty")
+        selected_fields = parse_fields(request.fields)
+        return await run_in_threadpool(run_session_query, session_id, request, selected_fields)
+
+@app.post("/sessions/{session_id}/turns/{turn}/result/")
+async def report_turn_result(session_id: str, turn: int, request: TurnResult):
+        """
+        Report whether the code of a turn ran in the client's session process.
+        Later follow-ups are told which steps failed, so they don't build on
+        variables those steps never defined. Turns not reported are marked as such
+        """
+        try:
+            await run_in_threadpool(dataset_store.set_turn_result, session_id, turn, request.success, request.error)
+        except SessionNotFound:
+            raise HTTPException(status_code=404, detail=f"Turn {turn} of session {session_id} not found")
+        return {"session_id": session_id, "turn": turn, "status": "succeeded" if request.success else "failed"}
+
+@app.post("/analyze/", response_model=AnalysisResponse, response_model_exclude_none=True)
 async def analyze_with_files(
     query: str,
     flight_bookings: UploadFile = File(...),
-    airline_mapping: UploadFile = File(...)
+    airline_mapping: UploadFile = File(...),
+    flight_bookings_sha256: Optional[str] = None,
+    airline_mapping_sha256: Optional[str] = None,
+    sample: bool = False,
+    sample_frac: float = DEFAULT_SAMPLE_FRAC,
+    fields: Optional[str] = None,
+    include_reasoning: bool = True
 ):
         """
-        Upload files and perform analysis in a single request
+        Upload files and perform analysis in a single request.
+        With sample=true the response also carries the sampling plan the client
+        uses to preview the generated code on a stratified sample.
+        fields is a comma separated subset of plan, agents, final_code (default all),
+        include_reasoning=false drops the chain-of-thought of every stage
         """
-    # try:
+        selected_fields = parse_fields(fields)
         # First upload the files
-        upload_response = await upload_files(flight_bookings, airline_mapping)
-        
-        
-        # # Then perform analysis
-        auto_analyst_instance = auto_analyst(
-            agents=AVAILABLE_AGENTS,
-            flight_bookings_path=upload_response['files']['flight_bookings'],
-            airline_mapping_path=upload_response['files']['airline_mapping']
+        upload_response = await upload_files(flight_bookings, airline_mapping, flight_bookings_sha256, airline_mapping_sha256)
+        # Then perform analysis
+        return await run_in_threadpool(
+            run_analysis, upload_response['dataset_id'], query, sample, sample_frac, selected_fields, include_reasoning
         )
-        analysis_result = auto_analyst_instance.forward(query)
-        print(query)
-        return {
-            "upload_status": "success",
-            "analysis_result": analysis_result
-        }
-        
-    # except Exception as e:
-    #     raise HTTPException(status_code=500, detail=f"Combined operation failed: {str(e)}")
 
 @app.get("/health/")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "auto_analyst_initialized": auto_analyst_instance is not None
+        "auto_analyst_initialized": bool(auto_analyst_instances),
+        "worker_pid": os.getpid()
     }
 
+@app.get("/ready/")
+async def readiness_check():
+    """Readiness endpoint, 503 until the agents are imported, configured and the preloaded datasets are loaded"""
+    return JSONResponse(
+        status_code=200 if warmup_state["ready"] else 503,
+        content={
+            "ready": warmup_state["ready"],
+            "error": warmup_state["error"],
+            "timings": warmup_state["timings"],
+            "worker_pid": os.getpid()
+        }
+    )
+
 
 
 if __name__ == "__main__":
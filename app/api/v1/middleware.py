@@ -0,0 +1,66 @@
+import json
+# FastAPI parses the whole multipart body before an endpoint runs, so oversized
+# uploads are rejected here, before the body is buffered: on the Content-Length
+# header when there is one, otherwise as soon as the streamed body passes the limit.
+# FastAPI turns any error raised while reading the body into a 400, so in the
+# streamed case the 413 is sent from receive() and the app is told the client
+# disconnected; whatever it tries to send afterwards is dropped.
+
+
+class RequestSizeLimitMiddleware:
+    def __init__(self, app, max_body_bytes):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def _respond(self, send, status, detail):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _reject(self, send):
+        await self._respond(send, 413, f"Request body is larger than {self.max_body_bytes} bytes")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None:
+            try:
+                content_length = int(content_length)
+            except ValueError:
+                return await self._respond(send, 400, "Invalid Content-Length header")
+            if content_length > self.max_body_bytes:
+                return await self._reject(send)
+
+        received = 0
+        response_started = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    rejected = True
+                    if not response_started:
+                        await self._reject(send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        await self.app(scope, limited_receive, tracked_send)
@@ -0,0 +1,42 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+# Cold-start check for the API: imports app.api.v1.main in fresh interpreters,
+# reports the median import time and exits non-zero if it is over budget or if
+# one of the heavy modules warm_up() is meant to defer got imported eagerly.
+#   python -m app.benchmarks.import_time --runs 5 --budget 1.0
+DEFERRED_MODULES = ['dspy', 'litellm', 'pandas', 'numpy', 'pyarrow']
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import app.api.v1.main
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'eager': [m for m in {DEFERRED_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def measure(runs):
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', PROBE], capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the import time of the API module')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=1.0, help='Maximum median import time in seconds')
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    median = statistics.median(r['seconds'] for r in results)
+    eager = sorted({m for r in results for m in r['eager']})
+    print(f"import app.api.v1.main: median {median:.3f}s over {args.runs} runs (budget {args.budget:.3f}s)")
+    if eager:
+        print(f"Imported eagerly, should be deferred to warm_up(): {', '.join(eager)}")
+    if median > args.budget or eager:
+        sys.exit(1)
@@ -0,0 +1,51 @@
+import sys
+from app.core.validator import validate_code
+# Regression cases for the static validator: generated snippets with the issues
+# validate_code must report for them, checked against the bookings columns below.
+# Exits non-zero if any case reports something else.
+#   python -m app.benchmarks.validator_cases
+BOOKINGS_COLUMNS = ['airline_id', 'booking_dt', 'departure_dt', 'price', 'seats']
+
+# name -> (code, expected issues)
+CASES = {
+    'known_columns': ("""
+df = df_name.copy()
+df['revenue'] = df['price'] * df['seats']
+print(df['revenue'].sum())
+""", []),
+    'unknown_column': ("""
+df = df_name.copy()
+print(df['fare'].mean())
+""", ["line 2: column 'fare' does not exist in the bookings data"]),
+    'loc_mask_creates_column': ("""
+df = df_name.copy()
+df.loc[df['price'] > 300, 'expensive'] = True
+print(df['expensive'].sum())
+""", []),
+    'loc_all_rows_creates_columns': ("""
+df = df_name.copy()
+df.loc[:, ['price_eur', 'price_gbp']] = 0
+print(df['price_eur'], df['price_gbp'])
+""", []),
+    'at_creates_column': ("""
+df = df_name.copy()
+df.at[0, 'note'] = 'first'
+print(df['note'])
+""", []),
+    'loc_on_other_frame_does_not_create_column': ("""
+df = df_name.copy()
+other = df['price']
+other.loc[0, 'flag'] = 1
+print(df['flag'])
+""", ["line 4: column 'flag' does not exist in the bookings data"]),
+}
+
+
+if __name__ == '__main__':
+    failed = 0
+    for name, (code, expected) in CASES.items():
+        issues = validate_code(code, BOOKINGS_COLUMNS)
+        ok = issues == expected
+        failed += not ok
+        print(f"{'ok' if ok else 'FAIL':<6}{name}" + ('' if ok else f"\n      expected {expected}\n      got      {issues}"))
+    sys.exit(1 if failed else 0)
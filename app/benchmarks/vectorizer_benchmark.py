@@ -0,0 +1,136 @@
+import argparse
+import sys
+import time
+import numpy as np
+import pandas as pd
+from app.core.vectorizer import vectorize_code
+# Times sample scripts in the style the agents generate before and after
+# vectorize_code, on a synthetic bookings frame, and checks both leave the same
+# variables with the same values. Exits non-zero if any rewrite changes a result.
+#   python -m app.benchmarks.vectorizer_benchmark --rows 200000
+
+SAMPLE_SCRIPTS = {
+    'row_apply_ifexp': """
+df = df_name.copy()
+df['revenue'] = df.apply(lambda row: row['price'] * row['seats'] if row['seats'] > 1 else row['price'], axis=1)
+""",
+    'row_apply_arithmetic': """
+df = df_name.copy()
+df['price_per_seat'] = df.apply(lambda row: row['price'] / row['seats'], axis=1)
+""",
+    'row_apply_negative_power': """
+df = df_name.copy()
+df['seat_share'] = df.apply(lambda row: row['seats'] ** -1, axis=1)
+""",
+    'row_apply_square': """
+df = df_name.copy()
+df['seats_sq'] = df.apply(lambda row: row['seats'] ** 2, axis=1)
+""",
+    'row_apply_none_branch': """
+df = df_name.copy()
+df['group_price'] = df.apply(lambda row: row['price'] + 1 if row['seats'] > 2 else None, axis=1)
+""",
+    'date_parsing_apply': """
+df = df_name.copy()
+df['departure_dt'] = df['departure_dt'].apply(lambda v: pd.to_datetime(v))
+""",
+    'date_parsing_strptime': """
+from datetime import datetime
+df = df_name.copy()
+df['booking_dt'] = df['booking_dt'].apply(lambda v: datetime.strptime(v, '%Y-%m-%d'))
+""",
+    'iterrows_lead_time': """
+df = df_name.copy()
+for i, row in df.iterrows():
+    df.at[i, 'lead_days'] = (pd.to_datetime(row['departure_dt']) - pd.to_datetime(row['booking_dt'])).days
+""",
+    'iterrows_flag': """
+df = df_name.copy()
+for idx, row in df.iterrows():
+    df.loc[idx, 'expensive'] = row['price'] > 300 and row['seats'] < 3
+""",
+    'iterrows_row_used_after': """
+df = df_name.copy()
+for i, row in df.iterrows():
+    df.at[i, 'price_x2'] = row['price'] * 2
+last_price = row['price']
+last_index = i
+""",
+    'time_strptime_apply': """
+import time
+df = df_name.copy()
+df['booking_tm'] = df['booking_dt'].apply(lambda v: time.strptime(v, '%Y-%m-%d'))
+""",
+    'groupby_transform': """
+df = df_name.copy()
+df['airline_avg_price'] = df.groupby('airline_id')['price'].transform(lambda s: s.mean())
+""",
+    'groupby_map': """
+df = df_name.copy()
+df['airline_bookings'] = df['airline_id'].map(df.groupby('airline_id')['price'].count())
+""",
+}
+
+
+def make_bookings(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    booking = pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D')
+    departure = booking + pd.to_timedelta(rng.integers(1, 120, rows), unit='D')
+    return pd.DataFrame({
+        'airline_id': rng.integers(1, 20, rows),
+        'booking_dt': booking.strftime('%Y-%m-%d'),
+        'departure_dt': departure.strftime('%Y-%m-%d'),
+        'price': rng.uniform(50, 900, rows).round(2),
+        'seats': rng.integers(1, 6, rows),
+    })
+
+
+def run(code, df_name):
+    namespace = {'pd': pd, 'np': np, 'df_name': df_name}
+    start = time.perf_counter()
+    try:
+        exec(code, namespace)
+    except Exception as e:
+        namespace = {'error': e}
+    elapsed = time.perf_counter() - start
+    return elapsed, {k: v for k, v in namespace.items() if not k.startswith('__') and not isinstance(v, type(np))}
+
+
+def same_value(a, b):
+    try:
+        if isinstance(a, pd.DataFrame):
+            pd.testing.assert_frame_equal(a, b, check_dtype=False, check_names=False)
+        elif isinstance(a, pd.Series):
+            pd.testing.assert_series_equal(a, b, check_dtype=False, check_names=False)
+        else:
+            return type(a) is type(b) and a == b
+        return True
+    except (AssertionError, TypeError):
+        return False
+
+
+def same_results(original, rewritten):
+# the rewritten script must run wherever the original does and leave the same
+# values; only loop variables nothing reads may be gone after a removed loop
+    if 'error' in rewritten and 'error' not in original:
+        return False
+    return rewritten.keys() <= original.keys() and all(same_value(original[k], rewritten[k]) for k in rewritten)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the vectorization rewriter')
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    df_name = make_bookings(args.rows)
+    print(f"{'script':<26}{'original':>12}{'rewritten':>12}{'speedup':>10}  equal  rewrites")
+    failed = 0
+    for name, code in SAMPLE_SCRIPTS.items():
+        new_code, rewrites = vectorize_code(code)
+        original_time, original = run(code, df_name)
+        new_time, rewritten = run(new_code, df_name)
+        equal = same_results(original, rewritten)
+        failed += not equal
+        print(f"{name:<26}{original_time:>11.3f}s{new_time:>11.3f}s{original_time / new_time:>9.1f}x  "
+              f"{str(equal):<5}  {', '.join(rewrites) or '-'}")
+    sys.exit(1 if failed else 0)
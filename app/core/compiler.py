@@ -0,0 +1,112 @@
+import argparse
+import ast
+import json
+import os
+import dspy
+# Offline compile step for the agents. BootstrapFewShot runs the programs over
+# the stored flight-analytics queries and keeps the demos that pass the metrics
+# below; the compiled state is written to disk and loaded by auto_analyst.
+DEFAULT_QUERIES_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'flight_queries.json')
+DEFAULT_COMPILED_DIR = os.path.join(os.path.dirname(__file__), '..', 'compiled')
+
+
+def compiled_path(compiled_dir, name):
+    return os.path.join(compiled_dir, f'{name}.json')
+
+
+def load_queries(path=DEFAULT_QUERIES_PATH):
+    with open(path) as f:
+        return [q['goal'] for q in json.load(f)]
+
+
+def plan_metric(agent_names):
+# A plan is only usable by auto_analyst.forward if it is Agent1->Agent2
+# and every step names a registered agent, anything else costs a refine round-trip
+    def metric(example, pred, trace=None):
+        if '->' not in pred.plan:
+            return False
+        return all(p.strip() in agent_names for p in pred.plan.split('->'))
+    return metric
+
+
+def code_metric(example, pred, trace=None):
+# The generated code has to at least parse, otherwise the combiner has to fix it
+    code = pred.code.strip()
+    if code.startswith('```python'):
+        code = code[9:]
+    if code.endswith('```'):
+        code = code[:-3]
+    try:
+        ast.parse(code)
+    except SyntaxError:
+        return False
+    return bool(code.strip())
+
+
+def compile_programs(analyst, goals, compiled_dir=DEFAULT_COMPILED_DIR, max_bootstrapped_demos=3):
+    """
+    Compile the planner and the analysis agents of an auto_analyst instance
+    and save the compiled programs to compiled_dir
+    """
+    os.makedirs(compiled_dir, exist_ok=True)
+    dataset = str(analyst.flight_bookings)
+    agent_desc = str(analyst.agent_desc)
+
+    planner_trainset = [
+        dspy.Example(dataset=dataset, Agent_desc=agent_desc, goal=g).with_inputs('dataset', 'Agent_desc', 'goal')
+        for g in goals
+    ]
+    optimizer = dspy.BootstrapFewShot(metric=plan_metric(set(analyst.agents)), max_bootstrapped_demos=max_bootstrapped_demos, max_labeled_demos=0)
+    planner = optimizer.compile(analyst.planner, trainset=planner_trainset)
+    planner.save(compiled_path(compiled_dir, 'analytical_planner'))
+    saved = ['analytical_planner']
+
+    agent_trainset = [
+        dspy.Example(dataset=dataset, goal=g).with_inputs('dataset', 'goal')
+        for g in goals
+    ]
+    for name, agent in analyst.agents.items():
+        optimizer = dspy.BootstrapFewShot(metric=code_metric, max_bootstrapped_demos=max_bootstrapped_demos, max_labeled_demos=0)
+        compiled = optimizer.compile(agent, trainset=agent_trainset)
+        compiled.save(compiled_path(compiled_dir, name))
+        saved.append(name)
+    return saved
+
+
+def load_compiled(analyst, compiled_dir=DEFAULT_COMPILED_DIR):
+    """
+    Load previously compiled programs into an auto_analyst instance, programs
+    without a saved file keep their uncompiled state
+    """
+    loaded = []
+    programs = {'analytical_planner': analyst.planner, **analyst.agents}
+    for name, program in programs.items():
+        path = compiled_path(compiled_dir, name)
+        if os.path.exists(path):
+            program.load(path)
+            loaded.append(name)
+    return loaded
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from app.core.processor import auto_analyst
+    from app.agents.analysis import preprocessing_agent, statistical_analytics_agent, sk_learn_agent
+
+    parser = argparse.ArgumentParser(description='Compile the auto_analyst agents with BootstrapFewShot')
+    parser.add_argument('--flight-bookings', required=True, help='Flight bookings CSV used as the dataset input')
+    parser.add_argument('--airline-mapping', default='Airline ID to Name.csv')
+    parser.add_argument('--queries', default=DEFAULT_QUERIES_PATH)
+    parser.add_argument('--output-dir', default=DEFAULT_COMPILED_DIR)
+    parser.add_argument('--max-demos', type=int, default=3)
+    args = parser.parse_args()
+
+    load_dotenv(dotenv_path='.env')
+    dspy.configure(lm=dspy.LM('openai/gpt-4o-mini', api_key=os.getenv('OPENAI_API_KEY')))
+    analyst = auto_analyst(
+        agents=[preprocessing_agent, statistical_analytics_agent, sk_learn_agent],
+        flight_bookings_path=args.flight_bookings,
+        airline_mapping_path=args.airline_mapping
+    )
+    saved = compile_programs(analyst, load_queries(args.queries), args.output_dir, args.max_demos)
+    print(f"Compiled {', '.join(saved)} into {args.output_dir}")
@@ -1,10 +1,25 @@
 import dspy
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from app.agents.planner import analytical_planner
 from app.agents.combiner import code_combiner_agent
 from app.agents.goal_refiner import goal_refiner_agent
-import pandas as pd# This module takes only one input on initiation
+from app.agents.follow_up import follow_up_agent
+from app.core.compiler import load_compiled
+from app.core.validator import validate_code, strip_code_fences
+from app.core.vectorizer import vectorize_code
+from app.core.sampling import sampling_plan, DEFAULT_SAMPLE_FRAC
+from app.core.store import read_dataset
+
+# Earlier session steps and live variables put in a follow-up prompt, older ones are dropped
+MAX_FOLLOW_UP_STEPS = 5
+MAX_LIVE_VARIABLES = 30
+# tail of a failed step's error shown in a follow-up prompt
+MAX_STEP_ERROR_CHARS = 500
+
+# This module takes only one input on initiation
 class auto_analyst(dspy.Module):
-    def __init__(self,agents,flight_bookings_path='Flight Bookings.csv', airline_mapping_path='Airline ID to Name.csv'):
+    def __init__(self,agents,flight_bookings_path='Flight Bookings.csv', airline_mapping_path='Airline ID to Name.csv', compiled_dir=None, max_fix_attempts=2, flight_bookings=None, max_concurrent_llm_calls=8):
 # Defines the available agents, their inputs, and description
         self.agents = {}
         self.agent_inputs ={}
@@ -23,9 +38,23 @@ class auto_analyst(dspy.Module):
         self.planner = dspy.ChainOfThought(analytical_planner)
         self.refine_goal = dspy.ChainOfThought(goal_refiner_agent)
         self.code_combiner_agent = dspy.ChainOfThought(code_combiner_agent)
+# answers follow-ups in a session with only the new code, without a planner pass
+        self.follow_up_agent = dspy.ChainOfThought(follow_up_agent)
+# loads the few-shot demos produced offline by app/core/compiler.py, if any
+        self.compiled = load_compiled(self, compiled_dir) if compiled_dir else []
+# number of times the combiner gets the validation issues back before giving up
+        self.max_fix_attempts = max_fix_attempts
+# shared limit on concurrent LLM calls made by forward_batch
+        self.max_concurrent_llm_calls = max_concurrent_llm_calls
+        self.llm_slots = threading.BoundedSemaphore(max_concurrent_llm_calls)
 # these two retrievers are defined using llama-index retrievers
 # you can customize this depending on how you want your agents
-        self.flight_bookings=pd.read_csv(flight_bookings_path)
+# an already loaded frame (e.g. memory-mapped from the dataset store) skips the parse
+        self.flight_bookings=flight_bookings if flight_bookings is not None else read_dataset(flight_bookings_path)
+
+    def sampling_plan(self, frac=DEFAULT_SAMPLE_FRAC):
+# strata for previews are resolved against the loaded bookings columns
+        return sampling_plan(self.flight_bookings, frac)
         
     def forward(self, query):
 # This dict is used to quickly pass arguments for agent inputs
@@ -55,6 +84,132 @@ class auto_analyst(dspy.Module):
 # creates a list of all the generated code, to be combined as 1 script
             code_list.append(output_dict[p.strip()].code)
 # Stores the last output
-        output_dict['code_combiner_agent'] = self.code_combiner_agent(agent_code_list = str(code_list))
+        output_dict['code_combiner_agent'] = self.combine_code(code_list)
         
         return output_dict
+
+    def forward_batch(self, queries):
+# Analyses several queries against the loaded dataset in one pass. The dataset is
+# formatted once for all prompts, the queries run concurrently with every LLM call
+# under the shared llm_slots limit, and identical calls (same planner goal, same
+# agent and goal, same code list to combine) are made only once. A query that
+# fails doesn't fail the batch, its exception is returned in its place
+        dataset = str(self.flight_bookings)
+        agent_desc = str(self.agent_desc)
+        memo = {}
+        memo_lock = threading.Lock()
+
+        def limited(module, **kwargs):
+            with self.llm_slots:
+                return module(**kwargs)
+
+        def shared(key, fn):
+            with memo_lock:
+                future = memo.get(key)
+                owner = future is None
+                if owner:
+                    future = memo[key] = Future()
+            if owner:
+                try:
+                    future.set_result(fn())
+                except Exception as e:
+                    future.set_exception(e)
+            return future.result()
+
+        def analyse(query):
+            goal = query
+# same plan/refine loop as forward, bounded as the memoised calls would repeat
+# forever once the refiner returns a goal it was already given
+            for _ in range(self.max_fix_attempts + 1):
+                plan = shared(('plan', goal), lambda: limited(self.planner, goal=goal, dataset=dataset, Agent_desc=agent_desc))
+                if '->' in plan.plan:
+                    break
+                goal = shared(('refine', goal), lambda: limited(self.refine_goal, dataset=dataset, goal=goal, Agent_desc=agent_desc)).refined_goal
+            else:
+                raise ValueError(f"No plan found for the query after {self.max_fix_attempts + 1} refinements")
+            output_dict = {'analytical_planner': plan}
+            code_list = []
+            inputs_ = {'dataset': dataset, 'goal': goal, 'Agent_desc': agent_desc}
+            for p in plan.plan.split('->'):
+                name = p.strip()
+                inputs = {x: inputs_[x] for x in self.agent_inputs[name]}
+                output_dict[name] = shared(('agent', name, goal), lambda: limited(self.agents[name], **inputs))
+                code_list.append(output_dict[name].code)
+            output_dict['code_combiner_agent'] = shared(('combine', str(code_list)), lambda: self.combine_code(code_list, call=limited))
+            return output_dict
+
+        def analyse_or_error(query):
+            try:
+                return analyse(query)
+            except Exception as e:
+                return e
+
+        unique_queries = list(dict.fromkeys(queries))
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_llm_calls) as executor:
+            results = dict(zip(unique_queries, executor.map(analyse_or_error, unique_queries)))
+        return [results[q] for q in queries]
+
+    def follow_up(self, query, previous_steps, live_variables=None):
+# Answers a follow-up in a session. previous_steps are the (goal, plan, code, status,
+# error) of the earlier turns, status being whether the client's session process ran
+# the code, and live_variables describes what that process holds, {name: {type,
+# shape, columns}}. Only the new code is generated, against the live state, so
+# nothing is planned or recomputed
+        live_variables = live_variables or {}
+        steps = []
+        for goal, plan, code, status, error in previous_steps[-MAX_FOLLOW_UP_STEPS:]:
+            if status == 'succeeded':
+                execution = "# Execution: succeeded\n"
+            elif status == 'failed':
+                error = (error or '').strip()[-MAX_STEP_ERROR_CHARS:].replace('\n', '\n#   ')
+                execution = f"# Execution: failed, variables it defines may not exist\n#   {error}\n"
+            else:
+                execution = "# Execution: not reported, check live_variables\n"
+            steps.append(f"# Goal: {goal}\n" + (f"# Plan: {plan}\n" if plan else "") + execution + code)
+        variables = []
+        columns = set(map(str, self.flight_bookings.columns))
+        for name, desc in list(live_variables.items())[:MAX_LIVE_VARIABLES]:
+            variables.append(f"{name}: " + ", ".join(f"{k}={v}" for k, v in desc.items()))
+# columns created by earlier steps exist in the live frames, so they aren't flagged
+            columns.update(desc.get('columns') or {})
+        output_dict = {}
+        output_dict['follow_up_agent'] = self.generate_validated(
+            self.follow_up_agent, 'code', columns,
+            dataset=str(self.flight_bookings.dtypes),
+            previous_steps="\n\n".join(steps),
+            live_variables="\n".join(variables) or "None",
+            goal=query
+        )
+        prediction = output_dict['follow_up_agent']
+        output_dict['code_combiner_agent'] = dspy.Prediction(
+            refined_complete_code=prediction.code,
+            validation_issues=prediction.validation_issues,
+            vectorized_rewrites=prediction.vectorized_rewrites,
+            reasoning=prediction.get('reasoning')
+        )
+        return output_dict
+
+    def combine_code(self, code_list, call=None):
+# Combines the agent code into the final script
+        return self.generate_validated(
+            self.code_combiner_agent, 'refined_complete_code', self.flight_bookings.columns, call, agent_code_list=str(code_list)
+        )
+
+    def generate_validated(self, module, code_field, columns, call=None, **inputs):
+# Generates code with module and statically validates it against the given columns,
+# issues are sent back to the module so broken code never reaches execution
+        call = call or (lambda module, **kwargs: module(**kwargs))
+        feedback = ''
+        for attempt in range(self.max_fix_attempts + 1):
+            generated = call(module, validation_feedback=feedback, **inputs)
+# slow row-wise idioms that can be rewritten safely don't need another pass
+            code, rewrites = vectorize_code(strip_code_fences(generated[code_field]))
+            generated[code_field] = code
+            issues = validate_code(code, columns)
+            if not issues:
+                break
+            feedback = "Previous code:\n" + code + "\n\nIssues:\n" + "\n".join(issues)
+        generated.validation_issues = issues
+        generated.validation_attempts = attempt + 1
+        generated.vectorized_rewrites = rewrites
+        return generated
@@ -0,0 +1,54 @@
+# Sampling plan for fast previews. The server picks the strata from the real
+# bookings columns; the client applies the plan in the generated script, so the
+# preview runs on a small stratified sample instead of the full history.
+SAMPLE_SEED = 42
+DEFAULT_SAMPLE_FRAC = 0.05
+# column name keywords of the departure date, in order of preference
+MONTH_COLUMN_KEYWORDS = ('departure', 'flight_dt', 'date', '_dt')
+
+
+def _find_column(columns, *keywords):
+    for keyword in keywords:
+        for c in columns:
+            if keyword in str(c).lower():
+                return str(c)
+    return None
+
+
+def _parses_as_dates(column, sample_size=1000, min_share=0.9):
+    import pandas as pd
+    if pd.api.types.is_numeric_dtype(column):
+        return False
+    values = column.dropna().head(sample_size)
+    if values.empty:
+        return False
+    return pd.to_datetime(values, errors='coerce', format='mixed').notna().mean() >= min_share
+
+
+def month_column(flight_bookings):
+    """
+    Name of the departure date column the bookings are stratified and partitioned
+    by, if any: the first column named like a date whose values parse as dates,
+    so departure_airport isn't taken for departure_dt
+    """
+    for keyword in MONTH_COLUMN_KEYWORDS:
+        for c in flight_bookings.columns:
+            if keyword in str(c).lower() and _parses_as_dates(flight_bookings[c]):
+                return str(c)
+    return None
+
+
+def sampling_plan(flight_bookings, frac=DEFAULT_SAMPLE_FRAC, seed=SAMPLE_SEED):
+    """
+    Build the sampling plan for a bookings frame: stratified by airline and by
+    departure month, with a fixed seed so every preview sees the same rows
+    """
+    if not 0 < frac <= 1:
+        raise ValueError("Sample fraction must be in (0, 1]")
+    columns = list(flight_bookings.columns)
+    return {
+        'frac': frac,
+        'seed': seed,
+        'airline_column': _find_column(columns, 'airline'),
+        'month_column': month_column(flight_bookings),
+    }
@@ -0,0 +1,427 @@
+import hashlib
+import os
+from contextlib import contextmanager
+import shutil
+import sqlite3
+import tempfile
+import time
+import uuid
+from app.core.sampling import month_column
+# Dataset store shared by all API workers. Datasets live on local disk under
+# DATA_DIR and are registered in a SQLite file next to them, keyed by the hash
+# of their content, so the same extract uploaded to any worker is stored and
+# parsed once. The parsed bookings are kept as uncompressed Arrow files, one
+# per departure month and append, that every worker memory-maps instead of
+# holding a private copy. Daily deltas are appended as new partition files and
+# fold into running per-column statistics, so the history is never re-parsed.
+# Analysis sessions, the goals, plans and code of their turns and whether the
+# client managed to run that code, are kept in the
+# same SQLite file so a follow-up can be served by any worker.
+DATA_DIR = os.getenv('DATA_DIR', os.path.join(tempfile.gettempdir(), 'flight_analytics'))
+
+# key of the originally uploaded bookings in the appends table, deltas use their sha256
+BASE_APPEND = 'base'
+
+
+def read_dataset(path):
+# uploads are stored as CSV or Parquet, see app/core/uploads.py
+    import pandas as pd
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def split_by_month(frame, column, schema=None):
+    """
+    Convert a bookings frame to Arrow tables by the month of its date column
+    ('YYYY-MM', 'unknown' for unparseable dates, 'all' without a date column).
+    With a schema the columns must match it and are cast to its types
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    if schema is not None:
+        if set(table.column_names) != set(schema.names):
+            raise ValueError(f"Delta columns {sorted(table.column_names)} don't match the dataset columns {sorted(schema.names)}")
+        try:
+            table = table.select(schema.names).cast(schema)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            raise ValueError(f"Delta values don't match the dataset column types: {e}")
+    if column is None:
+        return {'all': table}
+    months = pd.to_datetime(frame[column], errors='coerce', format='mixed').dt.strftime('%Y-%m').fillna('unknown')
+# rows keep their relative order within a month
+    return {month: table.take(rows) for month, rows in months.groupby(months.to_numpy(), sort=True).indices.items()}
+
+
+def column_stats(table):
+    """(column, count, sum, sum of squares, min, max) of every numeric column, nulls skipped"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    stats = []
+    for name, column in zip(table.column_names, table.columns):
+        if not (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)):
+            continue
+        values = column.cast(pa.float64())
+        min_max = pc.min_max(values)
+        stats.append((
+            name,
+            pc.count(values).as_py(),
+            pc.sum(values).as_py() or 0.0,
+            pc.sum(pc.multiply(values, values)).as_py() or 0.0,
+            min_max['min'].as_py(),
+            min_max['max'].as_py(),
+        ))
+    return stats
+
+
+class DatasetNotFound(KeyError):
+    pass
+
+
+class SessionNotFound(KeyError):
+    pass
+
+
+class DatasetStore:
+    def __init__(self, root=DATA_DIR):
+        self.root = root
+        self.datasets_dir = os.path.join(root, 'datasets')
+        self.uploads_dir = os.path.join(root, 'uploads')
+        os.makedirs(self.datasets_dir, exist_ok=True)
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        self.db_path = os.path.join(root, 'datasets.sqlite3')
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS datasets (
+                    dataset_id TEXT PRIMARY KEY,
+                    bookings_path TEXT NOT NULL,
+                    mapping_path TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS appends (
+                    dataset_id TEXT NOT NULL,
+                    content_sha256 TEXT NOT NULL,
+                    rows INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (dataset_id, content_sha256)
+                )
+            """)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS partitions (
+                    dataset_id TEXT NOT NULL,
+                    partition TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    rows INTEGER NOT NULL
+                )
+            """)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS column_stats (
+                    dataset_id TEXT NOT NULL,
+                    column_name TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    sum REAL NOT NULL,
+                    sumsq REAL NOT NULL,
+                    min REAL,
+                    max REAL,
+                    PRIMARY KEY (dataset_id, column_name)
+                )
+            """)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    dataset_id TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS session_turns (
+                    session_id TEXT NOT NULL,
+                    turn INTEGER NOT NULL,
+                    query TEXT NOT NULL,
+                    plan TEXT,
+                    code TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    error TEXT,
+                    PRIMARY KEY (session_id, turn)
+                )
+            """)
+# session tables created before execution results were reported lack these columns
+            turn_columns = {row[1] for row in db.execute('PRAGMA table_info(session_turns)')}
+            if 'status' not in turn_columns:
+                db.execute("ALTER TABLE session_turns ADD COLUMN status TEXT NOT NULL DEFAULT 'pending'")
+                db.execute('ALTER TABLE session_turns ADD COLUMN error TEXT')
+# memory-mapped partition tables by path, opened once per worker
+        self._mapped_tables = {}
+
+    @contextmanager
+    def _connect(self):
+# WAL lets workers read while another one registers a dataset
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            db.execute('PRAGMA journal_mode=WAL')
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def upload_dir(self):
+        """Temporary directory for an incoming upload, on the same filesystem as the store"""
+        return tempfile.mkdtemp(dir=self.uploads_dir)
+
+    def dataset_dir(self, dataset_id):
+        return os.path.join(self.datasets_dir, dataset_id)
+
+    def register(self, bookings_path, mapping_path, bookings_sha256, mapping_sha256):
+        """
+        Move uploaded files into the store and return the dataset id. Uploading
+        content that is already registered returns the existing id
+        """
+        dataset_id = hashlib.sha256(f'{bookings_sha256}:{mapping_sha256}'.encode()).hexdigest()[:16]
+        target_dir = self.dataset_dir(dataset_id)
+        upload_dir = os.path.dirname(bookings_path)
+        if self.exists(dataset_id):
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            return dataset_id
+        try:
+# the rename is atomic, if another worker won the race its copy is kept
+            os.rename(upload_dir, target_dir)
+        except OSError:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+        with self._connect() as db:
+            db.execute(
+                'INSERT OR IGNORE INTO datasets VALUES (?, ?, ?, ?)',
+                (dataset_id,
+                 os.path.join(target_dir, os.path.basename(bookings_path)),
+                 os.path.join(target_dir, os.path.basename(mapping_path)),
+                 time.time())
+            )
+        return dataset_id
+
+    def exists(self, dataset_id):
+        with self._connect() as db:
+            return db.execute('SELECT 1 FROM datasets WHERE dataset_id = ?', (dataset_id,)).fetchone() is not None
+
+    def paths(self, dataset_id):
+        """Return (bookings_path, mapping_path) of a registered dataset"""
+        with self._connect() as db:
+            row = db.execute('SELECT bookings_path, mapping_path FROM datasets WHERE dataset_id = ?', (dataset_id,)).fetchone()
+        if row is None:
+            raise DatasetNotFound(dataset_id)
+        return row
+
+    def version(self, dataset_id):
+        """Number of deltas appended to a dataset, 0 as uploaded"""
+        self.paths(dataset_id)
+        with self._connect() as db:
+            return db.execute(
+                'SELECT COUNT(*) FROM appends WHERE dataset_id = ? AND content_sha256 != ?', (dataset_id, BASE_APPEND)
+            ).fetchone()[0]
+
+    def _mapped(self, path):
+        from pyarrow import feather
+
+        if path not in self._mapped_tables:
+            self._mapped_tables[path] = feather.read_table(path, memory_map=True)
+        return self._mapped_tables[path]
+
+    def _apply(self, dataset_id, key, tables):
+        """
+        Add month tables to a dataset as new partition files and fold them into the
+        column statistics. Each key is applied once, returns False if it already was
+        """
+        from pyarrow import feather
+
+        staging_dir = self.upload_dir()
+        files = []
+        for partition, table in tables.items():
+            staged_path = os.path.join(staging_dir, f'{partition}.arrow')
+            feather.write_feather(table, staged_path, compression='uncompressed')
+            path = os.path.join(self.dataset_dir(dataset_id), 'partitions', f'departure_month={partition}', f'part-{key[:16]}.arrow')
+            files.append((partition, staged_path, path, table.num_rows))
+        try:
+            with self._connect() as db:
+# the insert takes the write lock, so concurrent appends of the same file apply it once
+                claimed = db.execute(
+                    'INSERT OR IGNORE INTO appends VALUES (?, ?, ?, ?)',
+                    (dataset_id, key, sum(f[3] for f in files), time.time())
+                ).rowcount
+                if not claimed:
+                    return False
+                for partition, staged_path, path, rows in files:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(staged_path, path)
+                    db.execute('INSERT INTO partitions VALUES (?, ?, ?, ?)', (dataset_id, partition, path, rows))
+                for table in tables.values():
+                    db.executemany("""
+                        INSERT INTO column_stats VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (dataset_id, column_name) DO UPDATE SET
+                            count = count + excluded.count,
+                            sum = sum + excluded.sum,
+                            sumsq = sumsq + excluded.sumsq,
+                            min = coalesce(min(min, excluded.min), min, excluded.min),
+                            max = coalesce(max(max, excluded.max), max, excluded.max)
+                    """, [(dataset_id, *stats) for stats in column_stats(table)])
+            return True
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def _ensure_partitioned(self, dataset_id):
+# datasets are split by month the first time they are loaded, including ones
+# stored before partitioning, whose single Arrow file is then dropped
+        with self._connect() as db:
+            partitioned = db.execute(
+                'SELECT 1 FROM appends WHERE dataset_id = ? AND content_sha256 = ?', (dataset_id, BASE_APPEND)
+            ).fetchone()
+        if partitioned:
+            return
+        bookings_path, _ = self.paths(dataset_id)
+        frame = read_dataset(bookings_path)
+        self._apply(dataset_id, BASE_APPEND, split_by_month(frame, month_column(frame)))
+        legacy_path = os.path.join(self.dataset_dir(dataset_id), 'flight_bookings.arrow')
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+    def partitions(self, dataset_id, months=None):
+        """Paths of the partition files of a dataset in month order, only the given months if any"""
+        self._ensure_partitioned(dataset_id)
+        with self._connect() as db:
+            rows = db.execute(
+                'SELECT partition, path FROM partitions WHERE dataset_id = ? ORDER BY partition, rowid', (dataset_id,)
+            ).fetchall()
+        paths = [path for partition, path in rows if months is None or partition in months]
+        if not paths:
+            raise ValueError(f"Dataset {dataset_id} has no bookings for months {sorted(months)}")
+        return paths
+
+    def append(self, dataset_id, delta_path, delta_sha256):
+        """
+        Append a bookings delta to a registered dataset as new month partitions.
+        The delta must have the dataset's columns, appending the same content
+        twice is a no-op. Returns what was added and the new dataset version
+        """
+        try:
+            self.paths(dataset_id)
+            self._ensure_partitioned(dataset_id)
+            delta = read_dataset(delta_path)
+        finally:
+            shutil.rmtree(os.path.dirname(delta_path), ignore_errors=True)
+        import pandas as pd
+
+        first = self._mapped(self.partitions(dataset_id)[0])
+# the delta is split on the column the stored bookings were partitioned by
+        column = month_column(first.slice(0, 1000).to_pandas(types_mapper=pd.ArrowDtype))
+        tables = split_by_month(delta, column, first.schema)
+        applied = self._apply(dataset_id, delta_sha256, tables)
+        return {
+            'dataset_id': dataset_id,
+            'version': self.version(dataset_id),
+            'rows_appended': len(delta) if applied else 0,
+            'partitions': sorted(tables) if applied else [],
+        }
+
+    def stats(self, dataset_id):
+        """Row counts by partition and summary statistics of the numeric columns, kept up to date by append"""
+        self._ensure_partitioned(dataset_id)
+        with self._connect() as db:
+            partitions = db.execute(
+                'SELECT partition, SUM(rows) FROM partitions WHERE dataset_id = ? GROUP BY partition ORDER BY partition', (dataset_id,)
+            ).fetchall()
+            columns = db.execute(
+                'SELECT column_name, count, sum, sumsq, min, max FROM column_stats WHERE dataset_id = ?', (dataset_id,)
+            ).fetchall()
+        summary = {}
+        for name, count, total, sumsq, min_, max_ in columns:
+            mean = total / count if count else None
+            variance = (sumsq - total * mean) / (count - 1) if count > 1 else None
+            summary[name] = {
+                'count': count,
+                'mean': mean,
+                'std': max(variance, 0.0) ** 0.5 if variance is not None else None,
+                'min': min_,
+                'max': max_,
+            }
+        return {
+            'dataset_id': dataset_id,
+            'version': self.version(dataset_id),
+            'rows': sum(rows for _, rows in partitions),
+            'partitions': dict(partitions),
+            'columns': summary,
+        }
+
+    def write_bookings(self, dataset_id, path, months=None):
+        """
+        Write the stored bookings, including appended deltas, to a Parquet file,
+        only the given months if any. Partitions are written one at a time
+        """
+        import pyarrow.parquet as pq
+
+        paths = self.partitions(dataset_id, months)
+        with pq.ParquetWriter(path, self._mapped(paths[0]).schema) as writer:
+            for partition_path in paths:
+                writer.write_table(self._mapped(partition_path))
+
+    def load_bookings(self, dataset_id, months=None):
+        """
+        Return the bookings frame, concatenated from the memory-mapped month
+        partitions, only those of the given months if any. Partition files are
+        opened once per worker, so after an append only the new ones are read
+        """
+        import pandas as pd
+        import pyarrow as pa
+
+        paths = self.partitions(dataset_id, months)
+# uncompressed Arrow buffers are used in place, the OS page cache is shared by all workers
+        return pa.concat_tables([self._mapped(path) for path in paths]).to_pandas(types_mapper=pd.ArrowDtype)
+
+    def create_session(self, dataset_id):
+        """Start an analysis session on a registered dataset and return its id"""
+        self.paths(dataset_id)
+        session_id = uuid.uuid4().hex
+        with self._connect() as db:
+            db.execute('INSERT INTO sessions VALUES (?, ?, ?)', (session_id, dataset_id, time.time()))
+        return session_id
+
+    def session_dataset(self, session_id):
+        with self._connect() as db:
+            row = db.execute('SELECT dataset_id FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+        if row is None:
+            raise SessionNotFound(session_id)
+        return row[0]
+
+    def session_turns(self, session_id):
+        """
+        (query, plan, code, status, error) of every turn of a session, in order.
+        status is pending until the client reports running the code, then
+        succeeded or failed
+        """
+        self.session_dataset(session_id)
+        with self._connect() as db:
+            return db.execute(
+                'SELECT query, plan, code, status, error FROM session_turns WHERE session_id = ? ORDER BY turn', (session_id,)
+            ).fetchall()
+
+    def add_session_turn(self, session_id, query, plan, code):
+        """Record the goal, plan (None for follow-ups) and code of a turn, return its number"""
+        with self._connect() as db:
+            db.execute(
+                'INSERT INTO session_turns (session_id, turn, query, plan, code, created_at) '
+                'SELECT ?, COALESCE(MAX(turn), 0) + 1, ?, ?, ?, ? FROM session_turns WHERE session_id = ?',
+                (session_id, query, plan, code, time.time(), session_id)
+            )
+            return db.execute('SELECT MAX(turn) FROM session_turns WHERE session_id = ?', (session_id,)).fetchone()[0]
+
+    def set_turn_result(self, session_id, turn, success, error=None):
+        """Record whether the client ran the code of a turn, later follow-ups are told"""
+        with self._connect() as db:
+            updated = db.execute(
+                'UPDATE session_turns SET status = ?, error = ? WHERE session_id = ? AND turn = ?',
+                ('succeeded' if success else 'failed', error, session_id, turn)
+            ).rowcount
+        if not updated:
+            raise SessionNotFound(f'{session_id} turn {turn}')
@@ -0,0 +1,226 @@
+import hashlib
+import os
+import zlib
+# Streams uploaded datasets to disk. Compressed uploads are decompressed chunk
+# by chunk while they are written, the sha256 of the bytes as sent is checked
+# against the one the client declared, and both the sent and the decompressed
+# sizes are capped so a small compressed file can't fill the disk or the memory.
+# This is blocking work, the API runs save_upload in the threadpool.
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', 512 * 1024 * 1024))
+MAX_DECOMPRESSED_BYTES = int(os.getenv('MAX_DECOMPRESSED_BYTES', 4 * 1024 * 1024 * 1024))
+
+# filename suffix -> (compression, extension of the file written to disk)
+SUPPORTED_FORMATS = {
+    '.csv': (None, '.csv'),
+    '.csv.gz': ('gzip', '.csv'),
+    '.csv.zst': ('zstd', '.csv'),
+    '.parquet': (None, '.parquet'),
+}
+
+
+class UploadError(Exception):
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def upload_format(filename):
+    """Return (compression, extension on disk) for an uploaded filename"""
+    filename = (filename or '').lower()
+# longest suffix first so .csv.gz doesn't match .csv
+    for suffix in sorted(SUPPORTED_FORMATS, key=len, reverse=True):
+        if filename.endswith(suffix):
+            return SUPPORTED_FORMATS[suffix]
+    raise UploadError(400, f"Unsupported file '{filename}', expected one of {', '.join(SUPPORTED_FORMATS)}")
+
+
+class _UploadReader:
+# Reads the upload as sent, hashing it and enforcing MAX_UPLOAD_BYTES
+    def __init__(self, upload):
+        self._file = upload.file
+        self._file.seek(0)
+        self.filename = upload.filename
+        self.hasher = hashlib.sha256()
+        self.received = 0
+
+    def read(self, size=CHUNK_SIZE):
+        chunk = self._file.read(size if size and size > 0 else CHUNK_SIZE)
+        self.received += len(chunk)
+        if self.received > MAX_UPLOAD_BYTES:
+            raise UploadError(413, f"{self.filename} is larger than {MAX_UPLOAD_BYTES} bytes")
+        self.hasher.update(chunk)
+        return chunk
+
+
+class _GzipDecompressor:
+# Output is produced in bounded pieces so the size limit is checked before a
+# highly compressed chunk is inflated in memory. zlib handles one gzip member
+# at a time, concatenated members start a new decompressor.
+    def decompress(self, source):
+        d = zlib.decompressobj(wbits=31)
+        while chunk := source.read(CHUNK_SIZE):
+            data = chunk
+            while data:
+                try:
+                    yield d.decompress(data, CHUNK_SIZE)
+                except zlib.error as e:
+                    raise UploadError(400, f"Invalid gzip upload: {e}")
+                if d.eof:
+                    data = d.unused_data
+                    if data:
+                        d = zlib.decompressobj(wbits=31)
+                else:
+                    data = d.unconsumed_tail
+        yield d.flush()
+        if not d.eof:
+            raise UploadError(400, "Truncated gzip upload")
+
+
+class _ZstdFrames:
+# zstandard's streaming readers stop quietly at the end of the input, even in
+# the middle of a frame. This follows the frame and block headers of the
+# compressed bytes (RFC 8878) to tell a complete upload from a truncated one.
+    def __init__(self):
+        self._pending = b''
+        self._skip = 0
+        self._state = 'frame'
+        self._checksum = False
+        self._frames = 0
+
+    @property
+    def complete(self):
+        return self._frames > 0 and self._state == 'frame' and not self._skip and not self._pending
+
+    def feed(self, data):
+        data = self._pending + data
+        pos = 0
+        while True:
+            step = min(self._skip, len(data) - pos)
+            self._skip -= step
+            pos += step
+            if self._skip:
+                break
+            header_end = self._header(data, pos)
+            if header_end is None:
+                break
+            pos = header_end
+        self._pending = data[pos:]
+
+    def _header(self, data, pos):
+# returns where the header starting at pos ends, None if it isn't all there yet
+        available = len(data) - pos
+        if self._state == 'checksum':
+            self._skip, self._state = 4, 'frame'
+            return pos
+        if self._state == 'block':
+            if available < 3:
+                return None
+            header = int.from_bytes(data[pos:pos + 3], 'little')
+            block_type = (header >> 1) & 3
+            if block_type == 3:
+                raise UploadError(400, "Invalid zstd upload: reserved block type")
+# RLE blocks carry a single byte whatever their size
+            self._skip = 1 if block_type == 1 else header >> 3
+            if header & 1:
+                self._state = 'checksum' if self._checksum else 'frame'
+            return pos + 3
+        if available < 4:
+            return None
+        magic = int.from_bytes(data[pos:pos + 4], 'little')
+        if 0x184D2A50 <= magic <= 0x184D2A5F:
+            if available < 8:
+                return None
+            self._skip = int.from_bytes(data[pos + 4:pos + 8], 'little')
+            return pos + 8
+        if magic != 0xFD2FB528:
+            raise UploadError(400, "Invalid zstd upload: unknown frame magic")
+        if available < 5:
+            return None
+        descriptor = data[pos + 4]
+        single_segment = (descriptor >> 5) & 1
+        header_size = (
+            5 + (not single_segment)
+            + (0, 1, 2, 4)[descriptor & 3]
+            + (single_segment, 2, 4, 8)[descriptor >> 6]
+        )
+        if available < header_size:
+            return None
+        self._checksum = bool((descriptor >> 2) & 1)
+        self._state = 'block'
+        self._frames += 1
+        return pos + header_size
+
+
+class _FrameTrackingReader:
+    def __init__(self, source, frames):
+        self._source = source
+        self._frames = frames
+
+    def read(self, size=CHUNK_SIZE):
+        chunk = self._source.read(size)
+        self._frames.feed(chunk)
+        return chunk
+
+
+class _ZstdDecompressor:
+# stream_reader pulls the upload as it decompresses and returns at most CHUNK_SIZE
+# bytes per read, so one small chunk can't inflate to gigabytes in memory
+    def __init__(self):
+        try:
+            import zstandard
+        except ImportError:
+            raise UploadError(415, "zstd uploads are not supported on this server, install zstandard")
+        self._zstd = zstandard
+
+    def decompress(self, source):
+        frames = _ZstdFrames()
+        tracked = _FrameTrackingReader(source, frames)
+        reader = self._zstd.ZstdDecompressor().stream_reader(tracked, read_size=CHUNK_SIZE, read_across_frames=True)
+        try:
+            while data := reader.read(CHUNK_SIZE):
+                yield data
+        except self._zstd.ZstdError as e:
+            raise UploadError(400, f"Invalid zstd upload: {e}")
+        if not frames.complete:
+            raise UploadError(400, "Truncated zstd upload")
+
+
+class _Passthrough:
+    def decompress(self, source):
+        while chunk := source.read(CHUNK_SIZE):
+            yield chunk
+
+
+DECOMPRESSORS = {None: _Passthrough, 'gzip': _GzipDecompressor, 'zstd': _ZstdDecompressor}
+
+
+def save_upload(upload, dest_dir, name, expected_sha256=None):
+    """
+    Stream an UploadFile to dest_dir/name.<ext>, decompressing on the fly.
+    Returns the path written, the sha256 of the uploaded bytes and the sha256
+    of the decompressed content, which identifies the dataset whatever the compression.
+    Blocking, so called from the threadpool
+    """
+    compression, extension = upload_format(upload.filename)
+    decompressor = DECOMPRESSORS[compression]()
+    path = os.path.join(dest_dir, name + extension)
+    source = _UploadReader(upload)
+    content_hasher = hashlib.sha256()
+    written = 0
+    try:
+        with open(path, 'wb') as out:
+            for data in decompressor.decompress(source):
+                written += len(data)
+                if written > MAX_DECOMPRESSED_BYTES:
+                    raise UploadError(413, f"{upload.filename} decompresses to more than {MAX_DECOMPRESSED_BYTES} bytes")
+                content_hasher.update(data)
+                out.write(data)
+        digest = source.hasher.hexdigest()
+        if expected_sha256 and expected_sha256.lower() != digest:
+            raise UploadError(400, f"sha256 mismatch for {upload.filename}, the upload was corrupted")
+    except UploadError:
+        os.remove(path)
+        raise
+    return path, digest, content_hasher.hexdigest()
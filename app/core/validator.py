@@ -0,0 +1,130 @@
+import ast
+# Static checks on the combined code before it is executed. Everything here
+# works on the AST only, so problems are found without starting an interpreter
+# or loading the bookings data.
+
+# Names the agents are told to use for the bookings frame
+FRAME_NAMES = {'df', 'df_name'}
+# Methods that return a frame with the same columns as the one they are called on
+COLUMN_PRESERVING_METHODS = {
+    'copy', 'dropna', 'fillna', 'query', 'head', 'tail', 'sample',
+    'sort_values', 'sort_index', 'drop_duplicates', 'reset_index', 'rename', 'assign'
+}
+
+
+def strip_code_fences(code):
+    """Remove the markdown fences the LLM wraps around code"""
+    code = code.strip()
+    if code.startswith('```python'):
+        code = code[9:]
+    elif code.startswith('```'):
+        code = code[3:]
+    if code.endswith('```'):
+        code = code[:-3]
+    return code.strip()
+
+
+def _string_keys(node):
+# df['col'] -> ['col'], df[['a', 'b']] -> ['a', 'b'], anything else -> []
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, ast.List) and all(isinstance(e, ast.Constant) and isinstance(e.value, str) for e in node.elts):
+        return [e.value for e in node.elts]
+    return []
+
+
+class _CodeChecker(ast.NodeVisitor):
+    def __init__(self, columns):
+        self.columns = {str(c) for c in columns}
+        self.frames = set(FRAME_NAMES)
+        self.issues = []
+        self.loop_depth = 0
+
+    def _is_frame(self, node):
+# True if the expression evaluates to a frame with the bookings columns
+        if isinstance(node, ast.Name):
+            return node.id in self.frames
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            return node.func.attr in COLUMN_PRESERVING_METHODS and self._is_frame(node.func.value)
+        if isinstance(node, ast.Subscript):
+# boolean filters and .loc row selections keep the columns, df['col'] does not
+            base = node.value
+            if isinstance(base, ast.Attribute) and base.attr in ('loc', 'iloc'):
+                return self._is_frame(base.value) and not isinstance(node.slice, ast.Tuple)
+            return self._is_frame(base) and not _string_keys(node.slice)
+        return False
+
+    def _track_target(self, target, value):
+        if isinstance(target, ast.Name):
+            if self._is_frame(value):
+                self.frames.add(target.id)
+            else:
+                self.frames.discard(target.id)
+        elif isinstance(target, ast.Subscript) and self._is_frame(target.value):
+# df['new_col'] = ... creates a column
+            self.columns.update(_string_keys(target.slice))
+        elif (isinstance(target, ast.Subscript) and isinstance(target.value, ast.Attribute)
+                and target.value.attr in ('loc', 'at') and self._is_frame(target.value.value)
+                and isinstance(target.slice, ast.Tuple) and len(target.slice.elts) == 2):
+# so do df.loc[mask, 'new_col'] = ..., df.loc[:, ['a', 'b']] = ... and df.at[i, 'new_col'] = ...
+            self.columns.update(_string_keys(target.slice.elts[1]))
+
+    def visit_Assign(self, node):
+        self.visit(node.value)
+        for target in node.targets:
+            self._track_target(target, node.value)
+            if isinstance(target, ast.Subscript):
+                self.visit(target.slice)
+
+    def visit_AugAssign(self, node):
+        self.visit(node.value)
+        self.visit(node.target)
+
+    def visit_Subscript(self, node):
+        if isinstance(node.ctx, ast.Load) and self._is_frame(node.value):
+            for key in _string_keys(node.slice):
+                if key not in self.columns:
+                    self.issues.append(f"line {node.lineno}: column '{key}' does not exist in the bookings data")
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Attribute):
+            attr = node.func.attr
+            if attr == 'iterrows':
+                self.issues.append(f"line {node.lineno}: row-wise iteration with iterrows(), use vectorized column operations instead")
+            elif attr == 'apply' and any(
+                k.arg == 'axis' and isinstance(k.value, ast.Constant) and k.value.value in (1, 'columns')
+                for k in node.keywords
+            ):
+                self.issues.append(f"line {node.lineno}: row-wise apply(axis=1), use vectorized column operations instead")
+            elif attr == 'assign':
+                self.columns.update(k.arg for k in node.keywords if k.arg)
+            elif attr == 'rename':
+                for k in node.keywords:
+                    if k.arg == 'columns' and isinstance(k.value, ast.Dict):
+                        self.columns.update(_string_keys(v)[0] for v in k.value.values if _string_keys(v))
+            if self.loop_depth and (attr == 'concat' or (attr == 'append' and self._is_frame(node.func.value))):
+                self.issues.append(f"line {node.lineno}: {attr}() inside a loop copies the frame on every iteration, collect the parts in a list and concat once")
+        self.generic_visit(node)
+
+    def _visit_loop(self, node):
+        self.loop_depth += 1
+        self.generic_visit(node)
+        self.loop_depth -= 1
+
+    visit_For = _visit_loop
+    visit_While = _visit_loop
+
+
+def validate_code(code, columns):
+    """
+    Statically check generated code against the columns of the bookings frame.
+    Returns a list of issues, empty if the code looks safe to run
+    """
+    try:
+        tree = ast.parse(strip_code_fences(code))
+    except SyntaxError as e:
+        return [f"line {e.lineno}: SyntaxError: {e.msg}"]
+    checker = _CodeChecker(columns)
+    checker.visit(tree)
+    return checker.issues
@@ -0,0 +1,307 @@
+import ast
+# Rewrites slow row-by-row pandas idioms in generated code into vectorized
+# equivalents. A pattern is only rewritten when every part of it is in the
+# whitelist below, so the result computes the same values; anything else is
+# left exactly as the LLM wrote it. Rewritten nodes are spliced back into the
+# original source, which keeps the comments and formatting of the rest.
+
+# Binary and comparison operators that behave the same on scalars and Series
+# apply(axis=1) hands the lambda Python ints on a mixed-dtype frame, so ** is only
+# safe with a non-negative constant exponent: int64 ** -1 raises where int ** -1 doesn't
+SAFE_BINOPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod)
+SAFE_CMPOPS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+# Series methods whose lambda form in groupby().transform has a cythonized string alias
+GROUPBY_AGGREGATIONS = {'mean', 'sum', 'min', 'max', 'count', 'std', 'var', 'median', 'first', 'last', 'nunique'}
+
+
+class _NotVectorizable(Exception):
+    pass
+
+
+def _is_to_datetime(func):
+    return (isinstance(func, ast.Attribute) and func.attr == 'to_datetime'
+            and isinstance(func.value, ast.Name) and func.value.id == 'pd')
+
+
+def _is_strptime(func):
+# datetime.strptime(...) or datetime.datetime.strptime(...), not time.strptime
+# which returns a struct_time
+    if not (isinstance(func, ast.Attribute) and func.attr == 'strptime'):
+        return False
+    owner = func.value
+    if isinstance(owner, ast.Name):
+        return owner.id == 'datetime'
+    return (isinstance(owner, ast.Attribute) and owner.attr == 'datetime'
+            and isinstance(owner.value, ast.Name) and owner.value.id == 'datetime')
+
+
+def _to_datetime_call(column, fmt=None):
+# format='mixed' parses every element on its own, exactly like calling
+# pd.to_datetime per value, but without the Python call per row
+    fmt = fmt if fmt is not None else ast.Constant(value='mixed')
+    return ast.Call(
+        func=ast.Attribute(value=ast.Name(id='pd', ctx=ast.Load()), attr='to_datetime', ctx=ast.Load()),
+        args=[column], keywords=[ast.keyword(arg='format', value=fmt)])
+
+
+def _vectorize_row_expr(node, row, frame):
+    """
+    Translate an expression of row['col'] lookups into the same expression
+    over frame['col'] columns, raises _NotVectorizable for anything else
+    """
+    if isinstance(node, ast.Subscript):
+        if (isinstance(node.value, ast.Name) and node.value.id == row
+                and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str)):
+            return ast.Subscript(value=ast.Name(id=frame, ctx=ast.Load()), slice=node.slice, ctx=ast.Load())
+        raise _NotVectorizable
+    if isinstance(node, ast.Constant):
+        return node
+    if isinstance(node, ast.BinOp) and isinstance(node.op, SAFE_BINOPS):
+        return ast.BinOp(left=_vectorize_row_expr(node.left, row, frame), op=node.op,
+                         right=_vectorize_row_expr(node.right, row, frame))
+    if (isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow) and isinstance(node.right, ast.Constant)
+            and type(node.right.value) in (int, float) and node.right.value >= 0):
+        return ast.BinOp(left=_vectorize_row_expr(node.left, row, frame), op=node.op, right=node.right)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return ast.UnaryOp(op=node.op, operand=_vectorize_row_expr(node.operand, row, frame))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not) and isinstance(node.operand, (ast.Compare, ast.BoolOp)):
+# `not` is only safe on booleans, where it becomes `~`
+        return ast.UnaryOp(op=ast.Invert(), operand=_vectorize_row_expr(node.operand, row, frame))
+    if isinstance(node, ast.Compare) and len(node.ops) == 1 and isinstance(node.ops[0], SAFE_CMPOPS):
+        return ast.Compare(left=_vectorize_row_expr(node.left, row, frame), ops=node.ops,
+                           comparators=[_vectorize_row_expr(node.comparators[0], row, frame)])
+    if isinstance(node, ast.BoolOp):
+# `and`/`or` are only safe on comparisons, where they become `&`/`|`
+        if not all(isinstance(v, ast.Compare) for v in node.values):
+            raise _NotVectorizable
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        values = [_vectorize_row_expr(v, row, frame) for v in node.values]
+        result = values[0]
+        for v in values[1:]:
+            result = ast.BinOp(left=result, op=op, right=v)
+        return result
+    if isinstance(node, ast.IfExp):
+        test = _vectorize_row_expr(node.test, row, frame)
+        if not isinstance(node.test, (ast.Compare, ast.BoolOp)):
+            raise _NotVectorizable
+# apply() turns a None branch into NaN in a float column, np.where keeps None in an object one
+        if any(isinstance(b, ast.Constant) and b.value is None for b in (node.body, node.orelse)):
+            raise _NotVectorizable
+        where = ast.Call(
+            func=ast.Attribute(value=ast.Name(id='np', ctx=ast.Load()), attr='where', ctx=ast.Load()),
+            args=[test, _vectorize_row_expr(node.body, row, frame), _vectorize_row_expr(node.orelse, row, frame)],
+            keywords=[])
+# keep the index so the result aligns like the Series apply() returned
+        return ast.Call(
+            func=ast.Attribute(value=ast.Name(id='pd', ctx=ast.Load()), attr='Series', ctx=ast.Load()),
+            args=[where],
+            keywords=[ast.keyword(arg='index', value=ast.Attribute(value=ast.Name(id=frame, ctx=ast.Load()), attr='index', ctx=ast.Load()))])
+    if isinstance(node, ast.Call) and _is_to_datetime(node.func) and len(node.args) == 1 and not node.keywords:
+        return _to_datetime_call(_vectorize_row_expr(node.args[0], row, frame))
+    raise _NotVectorizable
+
+
+def _single_arg_lambda(node):
+    if (isinstance(node, ast.Lambda) and len(node.args.args) == 1 and not node.args.vararg
+            and not node.args.kwarg and not node.args.kwonlyargs and not node.args.defaults):
+        return node.args.args[0].arg
+    return None
+
+
+def _rewrite_row_apply(node):
+# frame.apply(lambda row: <expr of row['col']>, axis=1) -> <expr of frame['col']>
+    if not (isinstance(node.func, ast.Attribute) and node.func.attr == 'apply'
+            and isinstance(node.func.value, ast.Name) and len(node.args) == 1):
+        return None
+    if [(k.arg, getattr(k.value, 'value', None)) for k in node.keywords] not in ([('axis', 1)], [('axis', 'columns')]):
+        return None
+    row = _single_arg_lambda(node.args[0])
+    if row is None:
+        return None
+    expr = _vectorize_row_expr(node.args[0].body, row, node.func.value.id)
+    if isinstance(expr, ast.Constant):
+        return None
+    return expr
+
+
+def _rewrite_column_apply(node):
+# frame['col'].apply(pd.to_datetime) / .apply(lambda v: pd.to_datetime(v))
+# / .apply(lambda v: datetime.strptime(v, fmt)) -> pd.to_datetime(frame['col'], ...)
+    if not (isinstance(node.func, ast.Attribute) and node.func.attr in ('apply', 'map')
+            and isinstance(node.func.value, ast.Subscript) and len(node.args) == 1 and not node.keywords):
+        return None
+    column = node.func.value
+    func = node.args[0]
+    if _is_to_datetime(func):
+        return _to_datetime_call(column)
+    arg = _single_arg_lambda(func)
+    if arg is None or not isinstance(func.body, ast.Call):
+        return None
+    call = func.body
+    if not (call.args and isinstance(call.args[0], ast.Name) and call.args[0].id == arg):
+        return None
+    if _is_to_datetime(call.func) and len(call.args) == 1 and not call.keywords:
+        return _to_datetime_call(column)
+    if (_is_to_datetime(call.func) and len(call.args) == 1 and len(call.keywords) == 1
+            and call.keywords[0].arg == 'format' and isinstance(call.keywords[0].value, ast.Constant)):
+        return _to_datetime_call(column, call.keywords[0].value)
+    if (_is_strptime(call.func) and len(call.args) == 2 and not call.keywords
+            and isinstance(call.args[1], ast.Constant) and isinstance(call.args[1].value, str)):
+        return _to_datetime_call(column, call.args[1])
+    return None
+
+
+def _rewrite_groupby_transform(node):
+# frame.groupby(k)[c].transform(lambda s: s.mean()) -> frame.groupby(k)[c].transform('mean')
+    if not (isinstance(node.func, ast.Attribute) and node.func.attr == 'transform'
+            and len(node.args) == 1 and not node.keywords):
+        return None
+    arg = _single_arg_lambda(node.args[0])
+    body = node.args[0].body if arg else None
+    if not (isinstance(body, ast.Call) and isinstance(body.func, ast.Attribute)
+            and body.func.attr in GROUPBY_AGGREGATIONS and not body.args and not body.keywords
+            and isinstance(body.func.value, ast.Name) and body.func.value.id == arg):
+        return None
+    return ast.Call(func=node.func, args=[ast.Constant(value=body.func.attr)], keywords=[])
+
+
+def _rewrite_groupby_map(node):
+# frame[k].map(frame.groupby(k)[c].agg()) -> frame.groupby(k)[c].transform('agg')
+    if not (isinstance(node.func, ast.Attribute) and node.func.attr == 'map'
+            and len(node.args) == 1 and not node.keywords):
+        return None
+    key_column, agg = node.func.value, node.args[0]
+    if not (isinstance(key_column, ast.Subscript) and isinstance(key_column.value, ast.Name)
+            and isinstance(agg, ast.Call) and isinstance(agg.func, ast.Attribute)
+            and agg.func.attr in GROUPBY_AGGREGATIONS and not agg.args and not agg.keywords):
+        return None
+    grouped = agg.func.value
+    if not (isinstance(grouped, ast.Subscript) and isinstance(grouped.value, ast.Call)):
+        return None
+    groupby = grouped.value
+    if not (isinstance(groupby.func, ast.Attribute) and groupby.func.attr == 'groupby'
+            and isinstance(groupby.func.value, ast.Name) and groupby.func.value.id == key_column.value.id
+            and len(groupby.args) == 1 and not groupby.keywords
+            and ast.dump(groupby.args[0]) == ast.dump(key_column.slice)):
+        return None
+    return ast.Call(func=ast.Attribute(value=grouped, attr='transform', ctx=ast.Load()),
+                    args=[ast.Constant(value=agg.func.attr)], keywords=[])
+
+
+def _rewrite_iterrows_loop(node):
+# for i, row in frame.iterrows(): frame.at[i, 'new'] = <expr of row['col']>
+# -> frame['new'] = <expr of frame['col']>
+    if node.orelse or len(node.body) != 1:
+        return None
+    it = node.iter
+    if not (isinstance(it, ast.Call) and isinstance(it.func, ast.Attribute) and it.func.attr == 'iterrows'
+            and isinstance(it.func.value, ast.Name) and not it.args):
+        return None
+    frame = it.func.value.id
+    if not (isinstance(node.target, ast.Tuple) and len(node.target.elts) == 2
+            and all(isinstance(e, ast.Name) for e in node.target.elts)):
+        return None
+    index, row = (e.id for e in node.target.elts)
+    stmt = node.body[0]
+    if not (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1):
+        return None
+    target = stmt.targets[0]
+    if not (isinstance(target, ast.Subscript) and isinstance(target.value, ast.Attribute)
+            and target.value.attr in ('at', 'loc') and isinstance(target.value.value, ast.Name)
+            and target.value.value.id == frame and isinstance(target.slice, ast.Tuple)
+            and len(target.slice.elts) == 2 and isinstance(target.slice.elts[0], ast.Name)
+            and target.slice.elts[0].id == index and isinstance(target.slice.elts[1], ast.Constant)
+            and isinstance(target.slice.elts[1].value, str)):
+        return None
+# the loop body must not see the index or write to the row it reads from
+    if any(isinstance(n, ast.Name) and n.id == index for n in ast.walk(stmt.value)):
+        return None
+    expr = _vectorize_row_expr(stmt.value, row, frame)
+    assign = ast.Assign(
+        targets=[ast.Subscript(value=ast.Name(id=frame, ctx=ast.Load()), slice=target.slice.elts[1], ctx=ast.Store())],
+        value=expr)
+    return assign
+
+
+EXPRESSION_REWRITES = [_rewrite_row_apply, _rewrite_column_apply, _rewrite_groupby_transform, _rewrite_groupby_map]
+
+
+def _loop_names_read_elsewhere(tree, loop):
+# The loop leaves its index and row variables bound to the last row, removing it
+# is only safe if no code outside it reads them. Reads inside another for loop
+# that binds the same names itself don't count
+    names = {n.id for n in ast.walk(loop.target) if isinstance(n, ast.Name)}
+    skip = {id(n) for n in ast.walk(loop)}
+    for other in ast.walk(tree):
+        if isinstance(other, (ast.For, ast.AsyncFor)) and other is not loop:
+            rebound = names & {n.id for n in ast.walk(other.target) if isinstance(n, ast.Name)}
+            if rebound == names:
+                skip.update(id(n) for n in ast.walk(other))
+    return any(isinstance(n, ast.Name) and n.id in names and isinstance(n.ctx, ast.Load) and id(n) not in skip
+               for n in ast.walk(tree))
+
+
+class _RewriteCollector(ast.NodeVisitor):
+    def __init__(self, tree):
+        self.tree = tree
+        self.replacements = []
+        self.applied = []
+
+    def _try(self, node, rewrites):
+        for rewrite in rewrites:
+            try:
+                new_node = rewrite(node)
+            except _NotVectorizable:
+                new_node = None
+            if new_node is not None:
+                self.replacements.append((node, ast.unparse(ast.fix_missing_locations(new_node))))
+                self.applied.append(f"line {node.lineno}: {rewrite.__name__[len('_rewrite_'):]}")
+                return True
+        return False
+
+    def visit_Call(self, node):
+        if not self._try(node, EXPRESSION_REWRITES):
+            self.generic_visit(node)
+
+    def visit_For(self, node):
+        if _loop_names_read_elsewhere(self.tree, node) or not self._try(node, [_rewrite_iterrows_loop]):
+            self.generic_visit(node)
+
+
+def _offsets(source):
+# byte offset of the start of every line, bytes.splitlines only splits on \n, \r and \r\n like the parser
+    starts = [0]
+    for line in source.splitlines(keepends=True):
+        starts.append(starts[-1] + len(line))
+    return starts
+
+
+def vectorize_code(code):
+    """
+    Rewrite known slow pandas idioms in code into vectorized equivalents.
+    Returns the new code and the list of rewrites applied; the original code
+    is returned unchanged if nothing could be rewritten safely
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code, []
+    collector = _RewriteCollector(tree)
+    collector.visit(tree)
+    if not collector.replacements:
+        return code, []
+# ast positions are utf-8 byte offsets, so the splicing is done on bytes
+    source = code.encode('utf-8')
+    starts = _offsets(source)
+    for node, replacement in sorted(collector.replacements, key=lambda r: (r[0].lineno, r[0].col_offset), reverse=True):
+        start = starts[node.lineno - 1] + node.col_offset
+        end = starts[node.end_lineno - 1] + node.end_col_offset
+        if isinstance(node, ast.stmt):
+            replacement = replacement.replace('\n', '\n' + ' ' * node.col_offset)
+        source = source[:start] + replacement.encode('utf-8') + source[end:]
+    new_code = source.decode('utf-8')
+    try:
+        ast.parse(new_code)
+    except SyntaxError:
+        return code, []
+    return new_code, collector.applied
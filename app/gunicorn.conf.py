@@ -0,0 +1,12 @@
+import multiprocessing
+import os
+# Multi-worker deployment: gunicorn -c gunicorn.conf.py api.v1.main:app
+# Workers share uploaded datasets, their parsed Arrow files and the LLM
+# response cache through DATA_DIR (see app/core/store.py), so any worker can
+# serve any dataset without it being uploaded or parsed again.
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'uvicorn_worker.UvicornWorker'
+# an analysis is a chain of several LLM calls
+timeout = int(os.getenv('WORKER_TIMEOUT', 300))
+graceful_timeout = 30
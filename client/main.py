@@ -6,6 +6,15 @@ import os
 import pandas as pd
 import sys
 import time
+import gzip
+import hashlib
+import json
+import queue
+import threading
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
 # Set page config
@@ -68,19 +77,47 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-def analyze_flight_data(query, flight_bookings_file, airline_mapping_file, api_url="https://flight-data-analytics-agent-1.onrender.com/analyze/"):
+def compress_upload(uploaded_file):
+    """
+    Compress an uploaded file for sending, returns (filename, bytes, sha256 of the bytes sent).
+    Parquet is already compressed and is sent as is
+    """
+    name = uploaded_file.name
+    data = uploaded_file.getvalue()
+    if name.lower().endswith('.parquet'):
+        payload = data
+    elif zstandard is not None:
+        payload = zstandard.ZstdCompressor(level=3, threads=-1).compress(data)
+        name += '.zst'
+    else:
+        payload = gzip.compress(data, compresslevel=6)
+        name += '.gz'
+    return name, payload, hashlib.sha256(payload).hexdigest()
+
+def analyze_flight_data(query, flight_bookings_file, airline_mapping_file, api_url="https://flight-data-analytics-agent-1.onrender.com/analyze/", sample_frac=None):
     """
-    Make request to flight analysis API
+    Make request to flight analysis API, sample_frac asks for a sampling plan for previews
     """
     try:
+        # Compress before sending, the API decompresses while streaming to disk
+        flight_bookings_name, flight_bookings_payload, flight_bookings_sha256 = compress_upload(flight_bookings_file)
+        airline_mapping_name, airline_mapping_payload, airline_mapping_sha256 = compress_upload(airline_mapping_file)
         files = {
-            'flight_bookings': flight_bookings_file,
-            'airline_mapping': airline_mapping_file,
+            'flight_bookings': (flight_bookings_name, flight_bookings_payload, 'application/octet-stream'),
+            'airline_mapping': (airline_mapping_name, airline_mapping_payload, 'application/octet-stream'),
         }
         
+        # Only the plan and the final code are rendered, so the agents' code and reasoning aren't requested
         params = {
-            'query': query
+            'query': query,
+            'fields': 'plan,final_code',
+            'include_reasoning': 'false',
+            'flight_bookings_sha256': flight_bookings_sha256,
+            'airline_mapping_sha256': airline_mapping_sha256
         }
+        if sample_frac:
+            params['sample'] = 'true'
+            params['sample_frac'] = sample_frac
         
         response = requests.post(api_url, files=files, params=params, timeout=300)
         response.raise_for_status()
@@ -90,6 +127,195 @@ def analyze_flight_data(query, flight_bookings_file, airline_mapping_file, api_u
     except Exception as e:
         return False, str(e)
 
+def api_base_url(api_url):
+    """Base URL of the API from the configured /analyze/ URL"""
+    return api_url.rsplit('/analyze/', 1)[0].rstrip('/')
+
+def upload_dataset(base_url, flight_bookings_file, airline_mapping_file):
+    """
+    Register both files with the API and return the dataset id
+    """
+    flight_bookings_name, flight_bookings_payload, flight_bookings_sha256 = compress_upload(flight_bookings_file)
+    airline_mapping_name, airline_mapping_payload, airline_mapping_sha256 = compress_upload(airline_mapping_file)
+    response = requests.post(
+        f"{base_url}/datasets/",
+        files={
+            'flight_bookings': (flight_bookings_name, flight_bookings_payload, 'application/octet-stream'),
+            'airline_mapping': (airline_mapping_name, airline_mapping_payload, 'application/octet-stream'),
+        },
+        params={
+            'flight_bookings_sha256': flight_bookings_sha256,
+            'airline_mapping_sha256': airline_mapping_sha256
+        },
+        timeout=300
+    )
+    response.raise_for_status()
+    return response.json()['dataset_id']
+
+def analyze_flight_data_batch(queries, flight_bookings_file, airline_mapping_file, api_url):
+    """
+    Upload the dataset once and analyze all queries against it with the batch endpoint
+    """
+    try:
+        base_url = api_base_url(api_url)
+        dataset_id = upload_dataset(base_url, flight_bookings_file, airline_mapping_file)
+        
+        response = requests.post(
+            f"{base_url}/datasets/{dataset_id}/analyze/batch/",
+            json={'queries': queries, 'fields': 'plan,final_code', 'include_reasoning': False},
+            timeout=900
+        )
+        response.raise_for_status()
+        
+        return True, response.json()
+        
+    except Exception as e:
+        return False, str(e)
+
+def start_analysis_session(flight_bookings_file, airline_mapping_file, api_url):
+    """
+    Upload the dataset and start a session for follow-up queries, returns the session id
+    """
+    try:
+        base_url = api_base_url(api_url)
+        dataset_id = upload_dataset(base_url, flight_bookings_file, airline_mapping_file)
+        response = requests.post(f"{base_url}/sessions/", params={'dataset_id': dataset_id}, timeout=60)
+        response.raise_for_status()
+        return True, response.json()['session_id']
+    except Exception as e:
+        return False, str(e)
+
+def query_analysis_session(session_id, query, live_variables, api_url):
+    """
+    Ask the next question of a session. The variables held by the session process
+    are sent along so follow-ups only generate the code that builds on them
+    """
+    try:
+        response = requests.post(
+            f"{api_base_url(api_url)}/sessions/{session_id}/query/",
+            json={'query': query, 'live_variables': live_variables, 'fields': 'plan,final_code', 'include_reasoning': False},
+            timeout=300
+        )
+        response.raise_for_status()
+        return True, response.json()
+    except Exception as e:
+        return False, str(e)
+
+def report_session_turn(session_id, turn, success, error, api_url):
+    """
+    Tell the server whether the code of a turn ran, so later follow-ups don't
+    build on variables a failed step never defined
+    """
+    try:
+        response = requests.post(
+            f"{api_base_url(api_url)}/sessions/{session_id}/turns/{turn}/result/",
+            json={'success': success, 'error': None if success else error[-2000:]},
+            timeout=60
+        )
+        response.raise_for_status()
+        return True, response.json()
+    except Exception as e:
+        return False, str(e)
+
+# Runs in the persistent process of an analysis session. Each request on stdin is
+# a JSON line with code to exec in the session namespace; the reply is a JSON
+# line with the captured output and a summary of the variables left in it.
+SESSION_WORKER = r'''
+import contextlib, io, json, os, sys, traceback
+
+# replies use the original stdout, output written straight to fd 1 goes to stderr
+protocol = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+os.dup2(2, 1)
+
+def describe(value):
+    pd = sys.modules.get('pandas')
+    np = sys.modules.get('numpy')
+    if pd is not None and isinstance(value, pd.DataFrame):
+        return {'type': 'DataFrame', 'shape': list(value.shape), 'columns': {str(c): str(t) for c, t in value.dtypes.items()}}
+    if pd is not None and isinstance(value, pd.Series):
+        return {'type': 'Series', 'shape': list(value.shape), 'value': f"name={value.name!r}, dtype={value.dtype}"}
+    if np is not None and isinstance(value, np.ndarray):
+        return {'type': 'ndarray', 'shape': list(value.shape), 'value': f"dtype={value.dtype}"}
+    if isinstance(value, (bool, int, float, str)) or (np is not None and isinstance(value, np.generic)):
+        return {'type': type(value).__name__, 'value': repr(value)[:200]}
+    if isinstance(value, (list, tuple, dict, set)):
+        return {'type': type(value).__name__, 'shape': [len(value)]}
+    return None
+
+namespace = {'__name__': '__main__'}
+for line in sys.stdin:
+    request = json.loads(line)
+    out, err = io.StringIO(), io.StringIO()
+    ok = True
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            exec(compile(request['code'], request['name'], 'exec'), namespace)
+        except BaseException:
+            ok = False
+            traceback.print_exc()
+    variables = {}
+    for name, value in list(namespace.items()):
+        if not name.startswith('_'):
+            desc = describe(value)
+            if desc:
+                variables[name] = desc
+    protocol.write(json.dumps({'ok': ok, 'stdout': out.getvalue(), 'stderr': err.getvalue(), 'variables': variables}) + '\n')
+    protocol.flush()
+'''
+
+class SessionRunner:
+    """
+    Persistent Python process of an analysis session. The code of every turn runs
+    in the same namespace, so follow-ups reuse the loaded data and the frames the
+    earlier turns computed instead of starting from scratch
+    """
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, '-u', '-c', SESSION_WORKER],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding='utf-8',
+            cwd=os.getcwd(),
+            env=dict(os.environ, PYTHONUNBUFFERED='1', PYTHONIOENCODING='utf-8')
+        )
+        self.replies = queue.Queue()
+        self.variables = {}
+        self.turns = 0
+        threading.Thread(target=self._read_replies, daemon=True).start()
+
+    def _read_replies(self):
+        for line in self.process.stdout:
+            self.replies.put(json.loads(line))
+        self.replies.put(None)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, code, timeout=600):
+        """
+        Execute code in the session namespace and capture output
+        """
+        if not self.alive():
+            return False, "", "The session process has exited, start a new session"
+        self.turns += 1
+        self.process.stdin.write(json.dumps({'code': code, 'name': f'<turn {self.turns}>'}) + '\n')
+        self.process.stdin.flush()
+        try:
+            reply = self.replies.get(timeout=timeout)
+        except queue.Empty:
+            self.close()
+            return False, "", "Script execution timed out after 10 minutes, the session was closed"
+        if reply is None:
+            return False, "", "The session process exited unexpectedly, start a new session"
+        self.variables = reply['variables']
+        return reply['ok'], reply['stdout'], reply['stderr']
+
+    def close(self):
+        if self.alive():
+            self.process.kill()
+
 def extract_required_imports(code):
     """
     Extract required imports from agent code and return installation commands
@@ -143,10 +369,52 @@ def extract_required_imports(code):
     
     return list(required_packages)
 
-def create_analysis_script(agent_code, flight_bookings_path, airline_mapping_path):
+def create_load_section(sampling_plan=None):
     """
-    Create the complete analysis script
+    Create the code that loads df_name, either the full bookings data or a
+    stratified sample following the server's sampling plan
     """
+    read_bookings = "(pd.read_parquet(flight_bookings_path) if flight_bookings_path.endswith('.parquet') else pd.read_csv(flight_bookings_path))"
+    if not sampling_plan:
+        return f"df_name = {read_bookings}"
+
+    return f"""sampling_plan = {sampling_plan!r}
+
+def stratified_sample(df, plan):
+    \"\"\"Keep frac of every airline/departure month stratum, at least one row each\"\"\"
+    strata = {{}}
+    if plan.get('airline_column') in df.columns:
+        strata['airline'] = df[plan['airline_column']]
+    if plan.get('month_column') in df.columns:
+        strata['month'] = pd.to_datetime(df[plan['month_column']], errors='coerce', format='mixed').dt.to_period('M')
+    if not strata:
+        return df.sample(frac=plan['frac'], random_state=plan['seed'])
+    keys = pd.DataFrame(strata, index=df.index)
+    keys['_rand'] = np.random.default_rng(plan['seed']).random(len(df))
+    grouped = keys.groupby(list(strata), dropna=False)['_rand']
+    keep = grouped.rank(method='first') <= np.maximum(1, np.ceil(grouped.transform('size') * plan['frac']))
+    return df[keep]
+
+# The sample is cached per dataset content, so repeated previews skip the full parse
+import hashlib
+import tempfile
+with open(flight_bookings_path, 'rb') as f:
+    dataset_hash = hashlib.file_digest(f, 'sha256').hexdigest()
+sample_key = hashlib.sha256((dataset_hash + repr(sorted(sampling_plan.items()))).encode()).hexdigest()
+sample_cache_path = os.path.join(tempfile.gettempdir(), 'flight_samples', sample_key + '.pkl')
+if os.path.exists(sample_cache_path):
+    df_name = pd.read_pickle(sample_cache_path)
+else:
+    df_name = stratified_sample({read_bookings}, sampling_plan)
+    os.makedirs(os.path.dirname(sample_cache_path), exist_ok=True)
+    df_name.to_pickle(sample_cache_path)
+print(f"[PREVIEW] Running on a {{sampling_plan['frac']:.0%}} stratified sample ({{len(df_name)}} rows)")"""
+
+def create_analysis_script(agent_code, flight_bookings_path, airline_mapping_path, sampling_plan=None):
+    """
+    Create the complete analysis script, run on a stratified sample when a sampling plan is given
+    """
+    load_section = create_load_section(sampling_plan)
     required_packages = extract_required_imports(agent_code)
     
     # Create package installation section
@@ -172,13 +440,17 @@ import sys
 import subprocess
 import warnings
 import os
+import io
 warnings.filterwarnings('ignore')
 
-# Set encoding for Windows compatibility
+# Set encoding for Windows compatibility, only on the console streams: a session
+# runs this script with its output captured in a StringIO, which can't be detached
 if sys.platform.startswith('win'):
     import codecs
-    sys.stdout = codecs.getwriter('utf-8')(sys.stdout.detach())
-    sys.stderr = codecs.getwriter('utf-8')(sys.stderr.detach())
+    if isinstance(sys.stdout, io.TextIOWrapper):
+        sys.stdout = codecs.getwriter('utf-8')(sys.stdout.detach())
+    if isinstance(sys.stderr, io.TextIOWrapper):
+        sys.stderr = codecs.getwriter('utf-8')(sys.stderr.detach())
 
 def install_package(package_name):
     \"\"\"Install a package using pip\"\"\"
@@ -263,7 +535,7 @@ flight_bookings_path = r"{flight_bookings_path}"
 airline_mapping_path = r"{airline_mapping_path}"
 
 # Read the flight bookings data
-df_name = pd.read_csv(flight_bookings_path)
+{load_section}
 print("Dataset loaded successfully!")
 print(f"Dataset shape: {{df_name.shape}}")
 print(f"Columns: {{list(df_name.columns)}}")
@@ -300,6 +572,24 @@ print("\\nAnalysis completed successfully!")
 """
     return complete_script
 
+def create_batch_analysis_script(agent_codes, queries, flight_bookings_path, airline_mapping_path):
+    """
+    Create one script that loads the data once and runs the code of every query,
+    each against its own copy of df_name, instead of one process per query
+    """
+    batch_code = f"""batch_snippets = {list(zip(queries, agent_codes))!r}
+batch_df = df_name
+for batch_index, (batch_query, batch_code) in enumerate(batch_snippets, 1):
+    print(f"\\n===== Query {{batch_index}}/{{len(batch_snippets)}}: {{batch_query}} =====")
+    # the names a single-query script has at module level, with a fresh df_name
+    batch_namespace = {{**{{k: v for k, v in globals().items() if not k.startswith('batch_')}}, 'df_name': batch_df.copy()}}
+    try:
+        exec(compile(batch_code, f'<query {{batch_index}}>', 'exec'), batch_namespace)
+    except Exception as e:
+        print(f"[ERROR] Query {{batch_index}} failed: {{e!r}}")
+    plt.close('all')"""
+    return create_analysis_script(batch_code, flight_bookings_path, airline_mapping_path)
+
 def execute_analysis_script(script_content):
     """
     Execute the analysis script and capture output
@@ -350,6 +640,137 @@ def save_uploaded_file(uploaded_file):
         return temp_path
     return None
 
+def run_batch_analysis(queries, flight_bookings_file, airline_mapping_file, api_url, flight_bookings_path, airline_mapping_path):
+    """Generate and execute the code for a list of queries about the same dataset"""
+    tab1, tab2, tab3 = st.tabs(["📡 API Call", "🔧 Code Generation", "⚡ Execution"])
+    
+    with tab1:
+        st.header("Batch Analysis Request")
+        st.subheader(f"{len(queries)} queries submitted:")
+        for i, q in enumerate(queries, 1):
+            st.write(f"{i}. {q}")
+        
+        with st.spinner("Calling batch analysis API..."):
+            flight_bookings_file.seek(0)
+            airline_mapping_file.seek(0)
+            success, result = analyze_flight_data_batch(queries, flight_bookings_file, airline_mapping_file, api_url)
+        
+        if not success:
+            st.markdown(f'<div class="status-error">[ERROR] API call failed: {result}</div>', unsafe_allow_html=True)
+            return
+        st.markdown('<div class="status-success">[SUCCESS] API call completed successfully!</div>', unsafe_allow_html=True)
+    
+    with tab2:
+        st.header("Code Generation")
+        agent_codes = []
+        generated_queries = []
+        for i, (q, query_result) in enumerate(zip(queries, result['results']), 1):
+            # a query the server could not analyse is reported and left out of the script
+            if query_result.get('error'):
+                st.markdown(f'<div class="status-error">[ERROR] Query {i} failed: {query_result["error"]}</div>', unsafe_allow_html=True)
+                continue
+            agent_code = query_result['code_combiner_agent']['refined_complete_code']
+            agent_codes.append(agent_code)
+            generated_queries.append(q)
+            with st.expander(f"🧠 Query {i}: {q}", expanded=False):
+                if query_result.get('analytical_planner'):
+                    st.write(f"**Plan:** {query_result['analytical_planner']['plan']}")
+                for issue in query_result['code_combiner_agent'].get('validation_issues', []):
+                    st.warning(issue)
+                st.code(agent_code, language='python')
+        batch_script = create_batch_analysis_script(agent_codes, generated_queries, flight_bookings_path, airline_mapping_path)
+    
+    with tab3:
+        st.header("Script Execution")
+        if not agent_codes:
+            st.info("No code was generated, nothing to execute")
+            return
+        with st.spinner("Executing all queries in one process... This may take a few minutes."):
+            success, output, error = execute_analysis_script(batch_script)
+        
+        if success:
+            st.markdown('<div class="status-success">[SUCCESS] Script execution completed!</div>', unsafe_allow_html=True)
+            if output:
+                with st.expander("📋 Execution Output", expanded=True):
+                    st.text(output)
+            if error:
+                with st.expander("⚠️ Warnings/Errors", expanded=False):
+                    st.text(error)
+        else:
+            st.markdown(f'<div class="status-error">[ERROR] Script execution failed: {error}</div>', unsafe_allow_html=True)
+
+def run_session_analysis(query, flight_bookings_file, airline_mapping_file, api_url, flight_bookings_path, airline_mapping_path):
+    """
+    Answer a query in the current analysis session, starting one first if there is
+    none for these files. The first turn runs the full analysis script in the session
+    process, follow-ups only run the new code against the variables it already holds
+    """
+    dataset_key = hashlib.sha256(flight_bookings_file.getvalue() + airline_mapping_file.getvalue()).hexdigest()
+    session = st.session_state.get('analysis_session')
+    if not session or session['dataset_key'] != dataset_key or not session['runner'].alive():
+        if session:
+            session['runner'].close()
+        with st.spinner("Starting analysis session..."):
+            success, session_id = start_analysis_session(flight_bookings_file, airline_mapping_file, api_url)
+        if not success:
+            st.markdown(f'<div class="status-error">[ERROR] Could not start a session: {session_id}</div>', unsafe_allow_html=True)
+            return
+        session = {'session_id': session_id, 'dataset_key': dataset_key, 'runner': SessionRunner(), 'turns': []}
+        st.session_state.analysis_session = session
+    
+    runner = session['runner']
+    with st.spinner("Calling session API..."):
+        success, result = query_analysis_session(session['session_id'], query, runner.variables, api_url)
+    if not success:
+        st.markdown(f'<div class="status-error">[ERROR] API call failed: {result}</div>', unsafe_allow_html=True)
+        return
+    
+    combined = result['result']['code_combiner_agent']
+    agent_code = combined['refined_complete_code']
+    script = agent_code if result['follow_up'] else create_analysis_script(agent_code, flight_bookings_path, airline_mapping_path)
+    with st.spinner("Executing in the session process..."):
+        success, output, error = runner.run(script)
+    reported, report = report_session_turn(session['session_id'], result['turn'], success, error, api_url)
+    if not reported:
+        st.warning(f"Could not report the execution result to the server: {report}")
+    session['turns'].append({
+        'query': query,
+        'follow_up': result['follow_up'],
+        'plan': (result['result'].get('analytical_planner') or {}).get('plan'),
+        'code': agent_code,
+        'validation_issues': combined.get('validation_issues', []),
+        'success': success,
+        'output': output,
+        'error': error
+    })
+
+def display_session_turns():
+    """Show the turns of the current analysis session, latest expanded"""
+    session = st.session_state.get('analysis_session')
+    if not session or not session['turns']:
+        return
+    st.header("💬 Analysis Session")
+    for i, turn in enumerate(session['turns'], 1):
+        label = "follow-up" if turn['follow_up'] else "analysis"
+        with st.expander(f"Turn {i} ({label}): {turn['query']}", expanded=i == len(session['turns'])):
+            if turn['plan']:
+                st.write(f"**Plan:** {turn['plan']}")
+            for issue in turn['validation_issues']:
+                st.warning(issue)
+            st.code(turn['code'], language='python')
+            if turn['success']:
+                st.markdown('<div class="status-success">[SUCCESS] Executed in the session process</div>', unsafe_allow_html=True)
+            else:
+                st.markdown('<div class="status-error">[ERROR] Execution failed</div>', unsafe_allow_html=True)
+            if turn['output']:
+                st.text(turn['output'])
+            if turn['error']:
+                st.text(turn['error'])
+    variables = session['runner'].variables
+    if variables:
+        with st.expander("🧮 Session variables", expanded=False):
+            st.json(variables)
+
 def main():
     # Main header
     st.markdown("""
@@ -365,14 +786,14 @@ def main():
         
         # File uploads
         flight_bookings_file = st.file_uploader(
-            "Upload Flight Bookings CSV",
-            type=['csv'],
+            "Upload Flight Bookings CSV or Parquet",
+            type=['csv', 'parquet'],
             help="Upload your flight bookings dataset"
         )
         
         airline_mapping_file = st.file_uploader(
-            "Upload Airline Mapping CSV",
-            type=['csv'],
+            "Upload Airline Mapping CSV or Parquet",
+            type=['csv', 'parquet'],
             help="Upload your airline ID to name mapping file"
         )
         
@@ -385,6 +806,39 @@ def main():
             help="URL of the flight analysis API"
         )
         
+        # Preview on a stratified sample while the question is being refined
+        sample_preview = st.checkbox(
+            "Preview on a sample",
+            value=False,
+            help="Run the generated code on a stratified sample (by airline and month) first, then on the full data on demand"
+        )
+        sample_percent = st.slider(
+            "Sample size (%)",
+            min_value=1,
+            max_value=50,
+            value=5,
+            disabled=not sample_preview
+        )
+        
+        # Batch mode: several queries about the same extract in one request
+        batch_mode = st.checkbox(
+            "Batch mode (one query per line)",
+            value=False,
+            help="Upload the dataset once, generate the code for every query in one API call and run it all in one process"
+        )
+        
+        # Conversation mode: follow-ups build on the previous results
+        conversation_mode = st.checkbox(
+            "Conversation mode (follow-up queries)",
+            value=False,
+            help="Keep the data and intermediate results in a session process, follow-up queries only generate and run the new code"
+        )
+        if conversation_mode and st.session_state.get('analysis_session'):
+            if st.button("🔄 New session"):
+                st.session_state.analysis_session['runner'].close()
+                del st.session_state['analysis_session']
+                st.rerun()
+        
         # Pre-install packages option
         pre_install = st.checkbox(
             "Pre-install common packages",
@@ -436,13 +890,59 @@ def main():
     
     # Clear results button
     if st.button("🧹 Clear Results"):
+        if st.session_state.get('analysis_session'):
+            st.session_state.analysis_session['runner'].close()
         for key in list(st.session_state.keys()):
             if key.startswith('analysis_'):
                 del st.session_state[key]
         st.rerun()
 
+    # Re-run the previewed code on the full data
+    if st.session_state.get('analysis_full_script') and not submit_button:
+        st.info("The last analysis ran on a sample. Run it on the full data when the preview looks right.")
+        if st.button("▶️ Run on full data"):
+            with st.spinner("Executing analysis on the full data... This may take a few minutes."):
+                success, output, error = execute_analysis_script(st.session_state.analysis_full_script)
+            if success:
+                st.markdown('<div class="status-success">[SUCCESS] Full data execution completed!</div>', unsafe_allow_html=True)
+                st.session_state.execution_output = output
+                st.session_state.execution_error = error
+                if output:
+                    with st.expander("📋 Execution Output", expanded=True):
+                        st.text(output)
+                if error:
+                    with st.expander("⚠️ Warnings/Errors", expanded=False):
+                        st.text(error)
+            else:
+                st.markdown(f'<div class="status-error">[ERROR] Script execution failed: {error}</div>', unsafe_allow_html=True)
+
+    # Session analysis execution
+    if conversation_mode:
+        if submit_button and flight_bookings_file and airline_mapping_file and query.strip():
+            flight_bookings_path = save_uploaded_file(flight_bookings_file)
+            airline_mapping_path = save_uploaded_file(airline_mapping_file)
+            
+            if not flight_bookings_path or not airline_mapping_path:
+                st.error("Failed to save uploaded files")
+                return
+            
+            run_session_analysis(query.strip(), flight_bookings_file, airline_mapping_file, api_url, flight_bookings_path, airline_mapping_path)
+        display_session_turns()
+    
+    # Batch analysis execution
+    elif submit_button and batch_mode and flight_bookings_file and airline_mapping_file and query.strip():
+        
+        flight_bookings_path = save_uploaded_file(flight_bookings_file)
+        airline_mapping_path = save_uploaded_file(airline_mapping_file)
+        
+        if not flight_bookings_path or not airline_mapping_path:
+            st.error("Failed to save uploaded files")
+            return
+        
+        run_batch_analysis([q.strip() for q in query.splitlines() if q.strip()], flight_bookings_file, airline_mapping_file, api_url, flight_bookings_path, airline_mapping_path)
+    
     # Analysis execution
-    if submit_button and flight_bookings_file and airline_mapping_file and query.strip():
+    elif submit_button and flight_bookings_file and airline_mapping_file and query.strip():
         
         # Save uploaded files
         flight_bookings_path = save_uploaded_file(flight_bookings_file)
@@ -471,7 +971,8 @@ def main():
                     query, 
                     flight_bookings_file, 
                     airline_mapping_file, 
-                    api_url
+                    api_url,
+                    sample_frac=sample_percent / 100 if sample_preview else None
                 )
             
             if success:
@@ -480,9 +981,13 @@ def main():
                 # Store result in session state
                 st.session_state.analysis_result = result
                 
-                # Display API response
-                with st.expander("🔍 View API Response", expanded=False):
-                    st.json(result)
+                # Display the analysis plan
+                plan = result['result'].get('analytical_planner')
+                if plan:
+                    with st.expander("🗺️ Analysis Plan", expanded=False):
+                        st.write(f"**Plan:** {plan['plan']}")
+                        if plan.get('plan_desc'):
+                            st.write(plan['plan_desc'])
                 
             else:
                 st.markdown(f'<div class="status-error">[ERROR] API call failed: {result}</div>', unsafe_allow_html=True)
@@ -495,8 +1000,8 @@ def main():
                 result = st.session_state.analysis_result
                 
                 # Extract agent code
-                if 'analysis_result' in result and 'code_combiner_agent' in result['analysis_result']:
-                    agent_code = result['analysis_result']['code_combiner_agent']['refined_complete_code']
+                if 'code_combiner_agent' in result.get('result', {}):
+                    agent_code = result['result']['code_combiner_agent']['refined_complete_code']
                     
                     # Clean the code
                     if agent_code.startswith('```python'):
@@ -505,14 +1010,27 @@ def main():
                         agent_code = agent_code[:-3]
                     
                     st.markdown('<div class="status-success">[SUCCESS] Agent code extracted successfully!</div>', unsafe_allow_html=True)
-                    
+
+                    # Issues the server-side validator could not get fixed by the combiner
+                    validation_issues = result['result']['code_combiner_agent'].get('validation_issues', [])
+                    if validation_issues:
+                        st.markdown('<div class="status-warning">[WARNING] Static validation found issues in the generated code</div>', unsafe_allow_html=True)
+                        for issue in validation_issues:
+                            st.write(f"- {issue}")
+
                     # Display the agent's code
                     with st.expander("🧠 Agent's Generated Code", expanded=True):
                         st.code(agent_code, language='python')
                     
                     # Generate complete script
-                    complete_script = create_analysis_script(agent_code, flight_bookings_path, airline_mapping_path)
+                    sampling_plan = result.get('sampling_plan')
+                    complete_script = create_analysis_script(agent_code, flight_bookings_path, airline_mapping_path, sampling_plan)
                     st.session_state.complete_script = complete_script
+                    # The full-data script is kept for the "Run on full data" action after a preview
+                    if sampling_plan:
+                        st.session_state.analysis_full_script = create_analysis_script(agent_code, flight_bookings_path, airline_mapping_path)
+                    else:
+                        st.session_state.pop('analysis_full_script', None)
                     
                     # Display required packages
                     required_packages = extract_required_imports(agent_code)